@@ -4,16 +4,67 @@ Handler for interactive agent conversation using Azure AI Foundry.
 - Provides reusable functions to create a conversation thread and process user prompts.
 - Can be imported and called by other scripts (e.g., FastAPI backend).
 - Supports an interactive CLI for testing the conversation flow.
+- Extracts the reply from the messages of the current run only and keeps an incrementally
+  synced transcript per thread, so a turn does not slow down as the thread grows.
+- Sends every Foundry call through a shared scheduler that paces calls to the quota and retries
+  throttled and transient failures, the SDK's own retries are turned off so they are not stacked.
+- Can stream a run as events (thread, text deltas, run step progress) for the streaming endpoint.
+- Is designed to be created once per process: the credential caches its access token,
+  HTTP connections are pooled and the connect agent is fetched only once.
 """
 
+import sys
+import os
+
+# Add the backend directory to the system path so the CLI can import the other handlers
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from azure.ai.projects import AIProjectClient
 from azure.identity import ClientSecretCredential
-from azure.ai.agents.models import ListSortOrder
+from azure.ai.agents.models import ListSortOrder, AgentStreamEvent, MessageDeltaChunk, RunStep, ThreadRun
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+from handlers.handler_thread_transcript import ThreadTranscriptCache
+from handlers.handler_foundry_scheduler import FoundryCallScheduler, INTERACTIVE
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import os
+import threading
+import requests
+import time
 
 load_dotenv()
 
+# Scope of the access token used by the Foundry project endpoint
+FOUNDRY_TOKEN_SCOPE = "https://ai.azure.com/.default"
+
+# Prefix of the reply returned when the agent run fails or is cancelled
+RUN_FAILED_PREFIX = "Run failed:"
+
+# Maximum number of messages of a run that are listed to find its reply
+RUN_REPLY_MESSAGE_LIMIT = int(os.getenv("RUN_REPLY_MESSAGE_LIMIT", "10"))
+
+# Seconds between two polls of the status of an agent run
+RUN_POLL_INTERVAL = float(os.getenv("RUN_POLL_INTERVAL", "1"))
+
+# Run statuses that are polled until the run ends
+RUN_ACTIVE_STATUSES = ("queued", "in_progress", "cancelling")
+
+# Reply returned for a run that ended without completing, its partial text is never used as the answer
+def run_failed_reply(run):
+    if run.status == "failed":
+        return f"{RUN_FAILED_PREFIX} {run.last_error}"
+    return f"{RUN_FAILED_PREFIX} run {run.status}"
+
+# Whether the error says the thread does not exist (e.g. it was deleted by the thread garbage collector)
+def is_thread_not_found(error):
+    return "No thread found with id" in str(error)
+
+# Maximum number of threads deleted concurrently
+THREAD_DELETE_MAX_CONCURRENCY = int(os.getenv("THREAD_DELETE_MAX_CONCURRENCY", "8"))
+
+# Maximum number of pooled HTTP connections to the Foundry endpoint
+FOUNDRY_HTTP_POOL_SIZE = int(os.getenv("FOUNDRY_HTTP_POOL_SIZE", "20"))
+
 class AgentConversationHandler:
     def __init__(self):
         self.ListSortOrder = ListSortOrder
@@ -22,37 +73,109 @@ class AgentConversationHandler:
             client_id=os.getenv("AZURE_CLIENT_ID"),
             client_secret=os.getenv("AZURE_CLIENT_SECRET")
         )
+        self.session = self._create_pooled_session(FOUNDRY_HTTP_POOL_SIZE)
+        # Retries (throttling, connection and server errors) are done by the scheduler, which also paces the calls to the quota
+        self.scheduler = FoundryCallScheduler()
         self.project = AIProjectClient(
             credential=self.credential,
-            endpoint=os.getenv("AZURE_AI_FOUNDRY_ENDPOINT")
+            endpoint=os.getenv("AZURE_AI_FOUNDRY_ENDPOINT"),
+            transport=RequestsTransport(session=self.session, session_owner=False),
+            retry_total=0
         )
         self.connect_agent_id = os.getenv("AZURE_AI_FOUNDRY_CONNECT_AGENT_ID")
+        self._connect_agent = None
+        self._connect_agent_lock = threading.Lock()
+        self.transcripts = ThreadTranscriptCache(self.project, self.scheduler)
+
+    @staticmethod
+    def _create_pooled_session(pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
     def get_connect_agent(self):
-        return self.project.agents.get_agent(self.connect_agent_id)
+        # The connect agent does not change while the app is running, so it is fetched once
+        if self._connect_agent is None:
+            with self._connect_agent_lock:
+                if self._connect_agent is None:
+                    self._connect_agent = self.scheduler.call("agents.get", self.project.agents.get_agent, self.connect_agent_id)
+        return self._connect_agent
+
+    def warm_up(self):
+        """Pre-fetch the access token and the connect agent before the first user request."""
+        self.credential.get_token(FOUNDRY_TOKEN_SCOPE)
+        self.get_connect_agent()
+        print(f"Warmed up Foundry client, connect agent ID: {self.connect_agent_id}\n")
+
+    def close(self):
+        self.project.close()
+        self.credential.close()
+        self.session.close()
+
+    def open_thread(self, thread):
+        """
+        Return the thread object for a thread, a thread ID or None (new thread).
+        A thread that no longer exists is replaced by a new one, the frontend sends the whole
+        conversation and picks up the new thread ID from the response.
+        """
+        if isinstance(thread, str):
+            try:
+                thread = self.get_thread(thread)
+                print(f"\nUsing existing thread, ID: {thread.id}\n")
+                return thread
+            except Exception as e:
+                if not is_thread_not_found(e):
+                    raise
+                print(f"\nThread {thread} no longer exists, continuing in a new thread.")
+                thread = None
+        if thread is None:
+            thread = self.create_thread()
+            print(f"\nCreated new thread, ID: {thread.id}\n")
+        return thread
 
     def create_thread(self):
-        return self.project.agents.threads.create()
+        return self.scheduler.call("threads.create", self.project.agents.threads.create)
 
     def get_thread(self, thread_id):
-        return self.project.agents.threads.get(thread_id)
+        return self.scheduler.call("threads.get", self.project.agents.threads.get, thread_id)
 
     def delete_thread(self, thread_id):
+        self.transcripts.forget(thread_id)
         print(f"\nDeleted thread, ID: {thread_id}\n")
-        return self.project.agents.threads.delete(thread_id)
+        return self.scheduler.call("threads.delete", self.project.agents.threads.delete, thread_id)
+
+    def delete_threads(self, thread_ids, max_workers=THREAD_DELETE_MAX_CONCURRENCY, priority=INTERACTIVE, should_delete=None):
+        """
+        Delete the threads concurrently and return the lists of deleted and failed thread IDs.
+        should_delete(thread_id) is called by the same workers before each delete, threads it
+        returns False for are kept and are in neither list.
+        """
+        def delete(thread_id):
+            # A thread that is already gone counts as deleted, so there is no need to get it first
+            try:
+                with self.scheduler.priority(priority):
+                    if should_delete is not None and not should_delete(thread_id):
+                        return thread_id, None
+                    self.delete_thread(thread_id)
+            except Exception as e:
+                if not is_thread_not_found(e):
+                    print(f"Error deleting thread {thread_id}: {e}")
+                    return thread_id, False
+            return thread_id, True
+
+        deleted, failed = [], []
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thread-delete") as executor:
+            for thread_id, ok in executor.map(delete, thread_ids):
+                if ok is not None:
+                    (deleted if ok else failed).append(thread_id)
+        return deleted, failed
 
     def delete_all_threads(self):
-        threads = self.project.agents.threads.list()
-        for thread in threads:
-            if thread.id is not None:
-                try:
-                    self.project.agents.threads.get(thread.id)
-                    self.delete_thread(thread.id)
-                except Exception as e:
-                    if "No thread found with id" in str(e):
-                        continue
-                    else:
-                        print(f"Error deleting thread {thread.id}: {e}")
+        # The IDs are listed first so deletes do not move the list cursor while paging
+        thread_ids = [thread.id for thread in self.scheduler.paged("threads.list", self.project.agents.threads.list()) if thread.id is not None]
+        return self.delete_threads(thread_ids)
 
     def send_user_message(self, thread_id, messages):
         if isinstance(messages, str):
@@ -63,41 +186,125 @@ class AgentConversationHandler:
             content = msg.get("content")
             if not isinstance(content, str):
                 content = str(content)
-            self.project.agents.messages.create(
+            self.scheduler.call(
+                "messages.create",
+                self.project.agents.messages.create,
                 thread_id=thread_id,
                 role=msg.get("role", "user"),
                 content=content
             )
 
-    def run_agent(self, thread_id, agent_id):
-        return self.project.agents.runs.create_and_process(
-            thread_id=thread_id,
-            agent_id=agent_id
-        )
+    def cancel_run(self, thread_id, run_id):
+        try:
+            self.scheduler.call("runs.cancel", self.project.agents.runs.cancel, thread_id=thread_id, run_id=run_id)
+            print(f"\nCancelled run {run_id} in thread {thread_id}\n")
+        except Exception as e:
+            print(f"Error cancelling run {run_id}: {e}")
+
+    def run_agent(self, thread_id, agent_id, cancel_event=None):
+        # Same as runs.create_and_process, with the status polls going through the scheduler
+        # Setting cancel_event cancels the run, which is then polled until it has stopped
+        run = self.scheduler.call("runs.create", self.project.agents.runs.create, thread_id=thread_id, agent_id=agent_id)
+        cancel_requested = False
+        while run.status in RUN_ACTIVE_STATUSES:
+            if cancel_event is not None and cancel_event.is_set() and not cancel_requested:
+                cancel_requested = True
+                self.cancel_run(thread_id, run.id)
+            else:
+                time.sleep(RUN_POLL_INTERVAL)
+            run = self.scheduler.call("runs.get", self.project.agents.runs.get, thread_id=thread_id, run_id=run.id)
+        return run
 
     def get_thread_messages(self, thread_id):
-        return self.project.agents.messages.list(thread_id=thread_id, order=self.ListSortOrder.DESCENDING)
+        return self.scheduler.paged("messages.list", self.project.agents.messages.list(thread_id=thread_id, order=self.ListSortOrder.DESCENDING))
+
+    def get_transcript(self, thread_id):
+        return self.transcripts.sync(thread_id)
+
+    def get_run_reply(self, thread_id, run_id):
+        # Only the newest messages created by this run are listed, whatever the thread length
+        messages = self.project.agents.messages.list(
+            thread_id=thread_id,
+            run_id=run_id,
+            order=self.ListSortOrder.DESCENDING,
+            limit=RUN_REPLY_MESSAGE_LIMIT
+        )
+        for message in self.scheduler.paged("messages.list", messages):
+            if message.text_messages:
+                return message.text_messages[-1].text.value
+        return None
 
-    def agent_conversation(self, messages, thread=None):
+    def agent_conversation(self, messages, thread=None, cancel_event=None):
         connect_agent = self.get_connect_agent()
-        if thread is None:
-            thread = self.create_thread()
-            print(f"\nCreated new thread, ID: {thread.id}\n")
-        elif isinstance(thread, str):
-            thread = self.get_thread(thread)
-            print(f"\nUsing existing thread, ID: {thread.id}\n")
+        thread = self.open_thread(thread)
 
         self.send_user_message(thread.id, messages)
-        run = self.run_agent(thread.id, connect_agent.id)
-        if run.status == "failed":
-            return f"Run failed: {run.last_error}", thread
+        if cancel_event is not None and cancel_event.is_set():
+            return f"{RUN_FAILED_PREFIX} cancelled before the run started", thread
+        run = self.run_agent(thread.id, connect_agent.id, cancel_event)
+        if run.status != "completed":
+            return run_failed_reply(run), thread
         else:
-            messages = self.project.agents.messages.list(thread_id=thread.id, order=self.ListSortOrder.ASCENDING)
-            response = None
-            for message in messages:
-                if message.text_messages:
-                    response = message.text_messages[-1].text.value
-            return response, thread
+            return self.get_run_reply(thread.id, run.id), thread
+
+    def replay_conversation(self, messages, response):
+        """Write the messages and an already known response into a new thread, without an agent run."""
+        thread = self.create_thread()
+        print(f"\nCreated new thread for cached response, ID: {thread.id}\n")
+        self.send_user_message(thread.id, messages)
+        self.send_user_message(thread.id, {"role": "assistant", "content": response})
+        return thread
+
+    def stream_agent_conversation(self, messages, thread=None):
+        """
+        Streaming version of agent_conversation, yields event dicts while the run is in progress.
+        The first event carries the thread ID, followed by "run", "run_step" and "delta" events,
+        and a final "done" (with the full reply) or "error" event.
+        Closing the generator before the run ends cancels the run.
+        """
+        connect_agent = self.get_connect_agent()
+        thread = self.open_thread(thread)
+        yield {"type": "thread", "thread_id": thread.id}
+
+        self.send_user_message(thread.id, messages)
+        run_id = None
+        run = None
+        finished = False
+        deltas = []
+        try:
+            with self.scheduler.call("runs.stream", self.project.agents.runs.stream, thread_id=thread.id, agent_id=connect_agent.id) as stream:
+                for event_type, event_data, _ in stream:
+                    if isinstance(event_data, MessageDeltaChunk):
+                        if event_data.text:
+                            deltas.append(event_data.text)
+                            yield {"type": "delta", "text": event_data.text}
+                    elif isinstance(event_data, ThreadRun):
+                        run_id = event_data.id
+                        run = event_data
+                        if run.status not in RUN_ACTIVE_STATUSES and run.status not in ("completed", "requires_action"):
+                            # Failed, cancelled, expired or incomplete, the partial text is not an answer
+                            finished = True
+                            yield {"type": "error", "error": run_failed_reply(run)}
+                            return
+                        yield {"type": "run", "run_id": run_id, "status": run.status}
+                    elif isinstance(event_data, RunStep):
+                        yield {"type": "run_step", "step_type": event_data.type, "status": event_data.status}
+                    elif event_type == AgentStreamEvent.ERROR:
+                        finished = True
+                        yield {"type": "error", "error": str(event_data)}
+                        return
+                    elif event_type == AgentStreamEvent.DONE:
+                        break
+            finished = True
+            # Only a run that reported completed has a full reply
+            if run is not None and run.status != "completed":
+                yield {"type": "error", "error": run_failed_reply(run)}
+            else:
+                yield {"type": "done", "response": "".join(deltas)}
+        finally:
+            # The client went away before the run ended, so stop spending tokens on it
+            if not finished and run_id is not None:
+                self.cancel_run(thread.id, run_id)
 
 def main():
     """Interactive CLI for agent conversation."""
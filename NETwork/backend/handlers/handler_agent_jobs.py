@@ -0,0 +1,216 @@
+"""
+Job queue for running agent conversation turns in the background.
+- Accepts a conversation turn as a job and returns its ID at once, so the request is not held
+  open for the length of the multi-agent run.
+- Runs the jobs on a fixed number of asyncio workers, each awaiting one agent run at a time.
+- Bounds the number of waiting jobs so acceptance stays fast and a backlog is rejected early.
+- Records per-job queue and run timings, supports cancellation and long polling for results.
+- Cancelling a running job cancels its worker task and signals its cancel event, which stops the
+  agent run and cancels the Foundry run, so no tokens are spent on a discarded result.
+- Keeps finished jobs for JOB_RESULT_TTL seconds before they are dropped.
+"""
+
+import threading
+import asyncio
+import uuid
+import time
+import math
+import os
+
+# Number of workers processing jobs, and maximum number of jobs waiting for a worker
+AGENT_JOB_WORKERS = int(os.getenv("AGENT_JOB_WORKERS", "4"))
+AGENT_JOB_MAX_QUEUE = int(os.getenv("AGENT_JOB_MAX_QUEUE", "100"))
+
+# Seconds a finished job is kept for its result to be fetched
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "600"))
+
+# Maximum number of seconds a long poll waits for a job to finish
+JOB_MAX_WAIT = int(os.getenv("JOB_MAX_WAIT", "30"))
+
+# Job states, a job is finished once it leaves queued and running
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+class AgentJobQueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Agent job queue is full, retry after {retry_after} seconds.")
+        self.retry_after = retry_after
+
+class AgentJob:
+    """
+    Class that holds the state of one queued conversation turn.\n
+
+    contents: The conversation messages sent by the frontend.\n
+    thread_id: The ID of the thread to continue, or None for a new thread.\n
+    """
+    def __init__(self, contents, thread_id=None):
+        self.id = uuid.uuid4().hex
+        self.contents = contents
+        self.thread_id = thread_id
+        self.status = JOB_QUEUED
+        self.response = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+        # Set when the job is cancelled, checked by the agent run on its worker thread
+        self.cancel_event = threading.Event()
+        self.task = None
+
+    def finish(self, status):
+        self.status = status
+        self.finished_at = time.time()
+        self.done.set()
+
+    def to_dict(self):
+        started_or_now = self.started_at or self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "response": self.response,
+            "thread_id": self.thread_id,
+            "error": self.error,
+            "queue_seconds": started_or_now - self.created_at,
+            "run_seconds": (self.finished_at or time.time()) - self.started_at if self.started_at else None,
+        }
+
+class AgentJobQueue:
+    """
+    Class that handles the queueing and processing of background agent jobs.\n
+
+    process: The coroutine function called with (contents, thread_id, cancel_event), returning (response, thread_id).\n
+    workers: The number of jobs processed at once.\n
+    max_queue: The maximum number of jobs waiting for a worker.\n
+    result_ttl: The number of seconds a finished job is kept.\n
+    """
+    def __init__(self, process, workers=AGENT_JOB_WORKERS, max_queue=AGENT_JOB_MAX_QUEUE, result_ttl=JOB_RESULT_TTL):
+        self.process = process
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        # Only used from the event loop thread, so no lock is needed
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.jobs = {}
+        self.tasks = []
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = {JOB_SUCCEEDED: 0, JOB_FAILED: 0, JOB_CANCELLED: 0}
+        self.average_run_seconds = None
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def retry_after(self):
+        # Estimate how long the queued jobs take to drain at the measured run duration
+        average = self.average_run_seconds or 5.0
+        return max(1, math.ceil(average * (self.queue.qsize() + self.running) / self.workers))
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [job.id for job in self.jobs.values() if job.finished_at and job.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def submit(self, contents, thread_id=None):
+        """Queue a conversation turn and return the job, raises AgentJobQueueFull when the queue is full."""
+        self._prune()
+        job = AgentJob(contents, thread_id)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise AgentJobQueueFull(self.retry_after())
+        self.jobs[job.id] = job
+        self.submitted += 1
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id, timeout):
+        """Wait up to timeout seconds (capped at JOB_MAX_WAIT) for the job to finish and return it."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=max(0, min(timeout, JOB_MAX_WAIT)))
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel the job and return it. A queued job is skipped by the workers, a running job has its
+        worker task cancelled and its agent run stopped. The worker counts as running until the task ends.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None and job.status in (JOB_QUEUED, JOB_RUNNING):
+            job.cancel_event.set()
+            if job.task is not None:
+                job.task.cancel()
+            job.finish(JOB_CANCELLED)
+            self.completed[JOB_CANCELLED] += 1
+        return job
+
+    def _record_run(self, seconds):
+        if self.average_run_seconds is None:
+            self.average_run_seconds = seconds
+        else:
+            self.average_run_seconds = 0.8 * self.average_run_seconds + 0.2 * seconds
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status == JOB_CANCELLED:
+                    continue
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                self.running += 1
+                job.task = asyncio.create_task(self.process(job.contents, job.thread_id, job.cancel_event))
+                try:
+                    response, thread_id = await job.task
+                    status, result = JOB_SUCCEEDED, {"response": response, "thread_id": thread_id}
+                except asyncio.CancelledError:
+                    if job.status != JOB_CANCELLED:
+                        # The worker itself is stopping, stop the agent run too
+                        job.cancel_event.set()
+                        raise
+                    status, result = JOB_CANCELLED, {}
+                except Exception as e:
+                    print(f"Agent job {job.id} failed:", e)
+                    status, result = JOB_FAILED, {"error": str(e)}
+                finally:
+                    self.running -= 1
+                    job.task = None
+                self._record_run(time.time() - job.started_at)
+                # A job cancelled while running has already been finished, its result is discarded
+                if job.status == JOB_RUNNING:
+                    for name, value in result.items():
+                        setattr(job, name, value)
+                    job.finish(status)
+                    self.completed[status] += 1
+            finally:
+                self.queue.task_done()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": self.queue.qsize(),
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": dict(self.completed),
+            "jobs": len(self.jobs),
+            "average_run_seconds": self.average_run_seconds,
+        }
@@ -0,0 +1,184 @@
+"""
+Answer cache for the first turn of new NETwork conversations.
+- Caches the reply to the opening prompt of a new chat, keyed on the normalized prompt.
+- Entries expire after FIRST_TURN_CACHE_TTL seconds, or as soon as the statistics data
+  version changes (the ETags of the stat files in blob storage).
+- Coalesces identical prompts that arrive together, so they share one in-flight agent run.
+- Cached answers are still written into a new thread by the caller, so later turns keep their context.
+"""
+
+from azure.storage.blob import ContainerClient
+from collections import OrderedDict
+from dotenv import load_dotenv
+import asyncio
+import threading
+import time
+import re
+import os
+
+load_dotenv()
+
+# Seconds a cached first-turn answer is served for, at most
+FIRST_TURN_CACHE_TTL = int(os.getenv("FIRST_TURN_CACHE_TTL", "3600"))
+
+# Maximum number of cached first-turn answers
+FIRST_TURN_CACHE_SIZE = int(os.getenv("FIRST_TURN_CACHE_SIZE", "512"))
+
+# The statistics data version is re-read from blob storage at most this often (seconds)
+STATS_VERSION_CHECK_INTERVAL = int(os.getenv("STATS_VERSION_CHECK_INTERVAL", "60"))
+
+# Blob storage container holding the statistics data uploaded by HandlerGithubStats
+BLOB_CONNECTION_STRING = os.getenv("AZURE_BLOB_CONNECTION_STRING")
+BLOB_CONTAINER_NAME_STAT = os.getenv("AZURE_BLOB_CONTAINER_NAME_STAT")
+
+# Normalize a prompt so trivial differences in case, spacing and punctuation share one entry
+def normalize_prompt(prompt):
+    prompt = re.sub(r"\s+", " ", prompt.strip().lower())
+    return prompt.rstrip("?!. ")
+
+# Return the prompt of a conversation that consists of a single user message, otherwise None
+def first_turn_prompt(contents):
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, dict):
+        contents = [contents]
+    if isinstance(contents, list) and len(contents) == 1 and contents[0].get("role", "user") == "user":
+        content = contents[0].get("content")
+        return content if isinstance(content, str) else None
+    return None
+
+class StatsDataVersion:
+    """
+    Class that handles the version of the statistics data served to the agents.\n
+
+    connection_string: The blob connection string.\n
+    container_name: The blob container name of the statistics data.\n
+    check_interval: The minimum number of seconds between two reads of the blob properties.\n
+    """
+    def __init__(self, connection_string=BLOB_CONNECTION_STRING, container_name=BLOB_CONTAINER_NAME_STAT, check_interval=STATS_VERSION_CHECK_INTERVAL):
+        self.container_client = None
+        if connection_string and container_name:
+            self.container_client = ContainerClient.from_connection_string(connection_string, container_name)
+        self.check_interval = check_interval
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def current(self):
+        # Without blob storage configured the version never changes and only the TTL applies
+        if self.container_client is None:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            if now - self.checked_at >= self.check_interval:
+                self.checked_at = now
+                try:
+                    blobs = self.container_client.list_blobs()
+                    self.version = "|".join(sorted(f"{blob.name}:{blob.etag}" for blob in blobs if blob.name.endswith("_stat_data.csv")))
+                except Exception as e:
+                    print("Statistics data version check failed:", e)
+            return self.version
+
+    def close(self):
+        if self.container_client is not None:
+            self.container_client.close()
+
+class FirstTurnCache:
+    """
+    Class that handles the caching and coalescing of first-turn agent answers.\n
+
+    data_version: The StatsDataVersion the cached answers are tied to.\n
+    ttl: The number of seconds a cached answer is served for, at most.\n
+    max_entries: The maximum number of cached answers.\n
+    """
+    def __init__(self, data_version=None, ttl=FIRST_TURN_CACHE_TTL, max_entries=FIRST_TURN_CACHE_SIZE):
+        self.data_version = data_version or StatsDataVersion()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Only used from the event loop thread, so no lock is needed
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.version = None
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    async def check_version(self):
+        version = await asyncio.to_thread(self.data_version.current)
+        if version != self.version:
+            if self.entries:
+                print("Statistics data version changed, first-turn cache cleared.")
+            self.entries.clear()
+            self.version = version
+
+    def lookup(self, prompt):
+        key = normalize_prompt(prompt)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["stored_at"] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry["answer"]
+
+    def store(self, prompt, answer):
+        key = normalize_prompt(prompt)
+        self.entries[key] = {"answer": answer, "stored_at": time.monotonic()}
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def answer(self, prompt, run, replay, cacheable):
+        """
+        Return (answer, thread) for a first-turn prompt.
+        run() starts an agent run in a new thread, replay(answer) writes a cached answer into a new thread,
+        and cacheable(answer) tells whether the answer of a run may be cached.
+        """
+        await self.check_version()
+        key = normalize_prompt(prompt)
+
+        answer = self.lookup(prompt)
+        if answer is not None:
+            self.hits += 1
+            return answer, await replay(answer)
+
+        # An identical prompt is already being answered, wait for its run instead of starting another
+        future = self.in_flight.get(key)
+        if future is not None:
+            answer = await asyncio.shield(future)
+            if answer is not None:
+                self.coalesced += 1
+                return answer, await replay(answer)
+            return await self.answer(prompt, run, replay, cacheable)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            answer, thread = await run()
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no other request was waiting
+            future.exception()
+            raise
+        else:
+            # Failed runs are not cached, waiting requests start their own run instead
+            if cacheable(answer):
+                self.store(prompt, answer)
+                future.set_result(answer)
+            return answer, thread
+        finally:
+            self.in_flight.pop(key, None)
+            if not future.done():
+                future.set_result(None)
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "in_flight": len(self.in_flight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "data_version": self.version,
+        }
@@ -0,0 +1,202 @@
+"""
+Scheduler for all calls made to the Azure AI Foundry endpoint.
+- Paces calls with a token bucket sized to the project quota (FOUNDRY_RATE_PER_SECOND, FOUNDRY_BURST).
+- Serves interactive calls before background work such as thread cleanup when tokens are scarce.
+- Retries throttled (429) and unavailable (503) calls with jittered exponential backoff, honouring
+  Retry-After, and pauses the whole bucket for that long so other calls do not hit the same limit.
+- Also retries connection errors and transient server errors (500, 502, 504), which the SDK's own
+  retry policy used to cover. Calls that create messages or runs are only retried when the request
+  cannot have been processed (429 or a failed connection), so a retry never posts a duplicate.
+- Keeps per-endpoint counters of calls, throttles, retries, failures and time spent waiting for tokens.
+"""
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import threading
+import random
+import time
+import os
+
+# Token bucket matched to the Foundry quota: sustained calls per second and burst size
+FOUNDRY_RATE_PER_SECOND = float(os.getenv("FOUNDRY_RATE_PER_SECOND", "10"))
+FOUNDRY_BURST = int(os.getenv("FOUNDRY_BURST", "20"))
+
+# Retries of throttled calls and the bounds of the exponential backoff (seconds)
+FOUNDRY_MAX_RETRIES = int(os.getenv("FOUNDRY_MAX_RETRIES", "5"))
+FOUNDRY_BACKOFF_BASE = float(os.getenv("FOUNDRY_BACKOFF_BASE", "0.5"))
+FOUNDRY_BACKOFF_MAX = float(os.getenv("FOUNDRY_BACKOFF_MAX", "30"))
+
+# Call priorities, interactive calls are served first
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Status codes of throttled calls, these pause the whole bucket
+THROTTLE_STATUS_CODES = (429, 503)
+
+# Status codes that are retried after a backoff, and the subset retried for non-idempotent calls
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+NON_IDEMPOTENT_RETRY_STATUS_CODES = (429,)
+
+# Endpoints that create a message or start a run, retrying them after the service received them posts a duplicate
+NON_IDEMPOTENT_ENDPOINTS = ("messages.create", "runs.create", "runs.stream")
+
+# Read the delay requested by the service from the Retry-After headers, or None
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        if headers.get(name):
+            try:
+                return float(headers[name]) / 1000
+            except ValueError:
+                pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+class FoundryCallScheduler:
+    """
+    Class that handles the pacing, prioritisation and retrying of Foundry API calls.\n
+
+    rate: The number of calls per second the token bucket refills.\n
+    burst: The maximum number of tokens in the bucket.\n
+    max_retries: The maximum number of retries of a throttled or failed call.\n
+    backoff_base: The backoff of the first retry in seconds, doubled on every retry.\n
+    backoff_max: The maximum backoff in seconds.\n
+    """
+    def __init__(self, rate=FOUNDRY_RATE_PER_SECOND, burst=FOUNDRY_BURST, max_retries=FOUNDRY_MAX_RETRIES, backoff_base=FOUNDRY_BACKOFF_BASE, backoff_max=FOUNDRY_BACKOFF_MAX):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.local = threading.local()
+        self.counters = {}
+
+    @contextmanager
+    def priority(self, priority):
+        """Run the calls made by the current thread inside the block at the given priority."""
+        previous = getattr(self.local, "priority", INTERACTIVE)
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def _counter(self, endpoint):
+        # Called with the condition held
+        return self.counters.setdefault(endpoint, {"calls": 0, "throttled": 0, "retries": 0, "failures": 0, "wait_seconds": 0.0})
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def _acquire(self, endpoint, priority):
+        start = time.monotonic()
+        with self.condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    # Background calls only take a token when no interactive call is waiting for one
+                    if now >= self.paused_until and self.tokens >= 1 and (priority == INTERACTIVE or self.waiting[INTERACTIVE] == 0):
+                        self.tokens -= 1
+                        break
+                    wait = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.01)
+                    self.condition.wait(timeout=wait)
+            finally:
+                self.waiting[priority] -= 1
+            self._counter(endpoint)["wait_seconds"] += time.monotonic() - start
+        # Another waiter may now be allowed to take a token
+        with self.condition:
+            self.condition.notify_all()
+
+    def _backoff(self, attempt, error, pause):
+        # Full jitter keeps retrying callers from hitting the endpoint in lockstep
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if pause:
+            with self.condition:
+                # Pause every call, the quota is shared by the whole project
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                self.tokens = min(self.tokens, 0.0)
+        return delay
+
+    @staticmethod
+    def _is_retryable(endpoint, error):
+        idempotent = endpoint not in NON_IDEMPOTENT_ENDPOINTS
+        if isinstance(error, ServiceRequestError):
+            # The request was never sent
+            return True
+        if isinstance(error, ServiceResponseError):
+            # The request may have been processed before the connection dropped
+            return idempotent
+        if isinstance(error, HttpResponseError):
+            return error.status_code in (RETRY_STATUS_CODES if idempotent else NON_IDEMPOTENT_RETRY_STATUS_CODES)
+        return False
+
+    def call(self, endpoint, function, *args, **kwargs):
+        """Call function(*args, **kwargs) once a token is available, retrying throttled and transient failures."""
+        priority = getattr(self.local, "priority", INTERACTIVE)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(endpoint, priority)
+            with self.condition:
+                self._counter(endpoint)["calls"] += 1
+            try:
+                return function(*args, **kwargs)
+            except StopIteration:
+                raise
+            except Exception as e:
+                throttled = isinstance(e, HttpResponseError) and e.status_code in THROTTLE_STATUS_CODES
+                if not self._is_retryable(endpoint, e) or attempt == self.max_retries:
+                    with self.condition:
+                        counter = self._counter(endpoint)
+                        counter["throttled"] += int(throttled)
+                        counter["failures"] += 1
+                    raise
+                delay = self._backoff(attempt, e, pause=throttled)
+                with self.condition:
+                    counter = self._counter(endpoint)
+                    counter["throttled"] += int(throttled)
+                    counter["retries"] += 1
+                reason = e.status_code if isinstance(e, HttpResponseError) else type(e).__name__
+                print(f"Foundry call '{endpoint}' failed with {reason}, retrying in {delay:.2f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+
+    def paged(self, endpoint, items):
+        """Iterate a paged list result, fetching every page through the scheduler."""
+        pages = items.by_page()
+        while True:
+            try:
+                page = self.call(endpoint, next, pages)
+            except StopIteration:
+                return
+            yield from page
+
+    def stats(self):
+        with self.condition:
+            self._refill(time.monotonic())
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "tokens": self.tokens,
+                "paused_seconds": max(0.0, self.paused_until - time.monotonic()),
+                "waiting": dict(self.waiting),
+                "endpoints": {endpoint: dict(counter) for endpoint, counter in self.counters.items()},
+            }
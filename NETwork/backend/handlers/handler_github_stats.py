@@ -1,14 +1,37 @@
 import os
+import sys
 import re
+import io
+import time
+import hashlib
+import requests
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from github import Github
 from datetime import datetime
 from azure.storage.blob import BlobServiceClient
 
+# Add the backend directory to the system path so the script can import the other handlers
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from handlers.handler_stats_store import StatsParquetStore
+from handlers.handler_ingestion_manifest import IngestionManifest
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Number of CSV files downloaded concurrently, the HTTP connection pool is sized to match
+GITHUB_DOWNLOAD_MAX_WORKERS = int(os.getenv("GITHUB_DOWNLOAD_MAX_WORKERS", "8"))
+GITHUB_DOWNLOAD_TIMEOUT = int(os.getenv("GITHUB_DOWNLOAD_TIMEOUT", "60"))
+
+# Directory of the Parquet statistics store, inside the local repository
+STATS_STORE_DIR = os.getenv("STATS_STORE_DIR", "stat_data_parquet")
+
+# SQLite ingestion manifest of the downloaded files, inside the local repository
+INGESTION_MANIFEST_FILE = os.getenv("INGESTION_MANIFEST_FILE", "ingestion_manifest.sqlite")
+
 class HandlerGithubStats:
     """
     Class that handles the download and storage of tennis statistcs from public Github repositories.\n
@@ -18,11 +41,17 @@ class HandlerGithubStats:
     list_repo_urls: The list of Github repository urls to download data from.\n
     blob_connection_string: The blob connection string.\n
     blob_container_name: The blob contaainer name.\n
+    max_workers: The number of CSV files downloaded concurrently.\n
     """
-    def __init__(self, github_client, repo_local, list_repo_urls, blob_connection_string, blob_container_name):
+    def __init__(self, github_client, repo_local, list_repo_urls, blob_connection_string, blob_container_name, max_workers=GITHUB_DOWNLOAD_MAX_WORKERS):
         self.github_client = github_client
         self.repo_local = repo_local
         self.list_repo_urls = list_repo_urls
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers))
+        self.stats_store = StatsParquetStore(f"{repo_local}/{STATS_STORE_DIR}")
+        self.manifest = IngestionManifest(f"{repo_local}/{INGESTION_MANIFEST_FILE}")
         self.blob_service_client = BlobServiceClient.from_connection_string(blob_connection_string)
         self.container_client = self.blob_service_client.get_container_client(blob_container_name)
 
@@ -36,78 +65,94 @@ class HandlerGithubStats:
         urls = [l for l in urls if int(re.sub(r"\D", "", l)) >= filter_start_year]
         return urls
 
-    def _update_url_archive_in_local_repo(self, urls, url_download_path):
-        df_urls = pd.DataFrame({"URL": urls})
-        initial = not os.path.exists(url_download_path)
-
-        # If the file does not exist, create it and write the URLs
-        if initial:
-            df_urls.to_csv(url_download_path, sep='\t', encoding='utf_8_sig', index=False)
-            return df_urls["URL"], initial
-
-        # If the file exists, read it and append new URLs
-        df_url_archive = pd.read_csv(url_download_path, sep=',', index_col=False)
-        new_urls = df_urls[~df_urls["URL"].isin(df_url_archive["URL"])]["URL"]
-        if not new_urls.empty:
-            new_urls.to_csv(url_download_path, sep=',', mode='a', encoding='utf_8_sig', header=False, index=False)
-        return new_urls, initial
-
-    def _download_and_update_url_content_in_local_repo(self, new_urls, stat_download_path):
-        df_master = pd.DataFrame()
-        for url in new_urls:
-            df_temp = pd.read_csv(url, sep=',', low_memory=False)
-            df_master = pd.concat([df_master, df_temp], ignore_index=True)
-
-        # If the master DataFrame is not empty, append it to the local stats file
-        if not df_master.empty:
-            df_master.to_csv(stat_download_path, sep=',', encoding='utf_8_sig', mode='a', header=True, index=False)
-        return df_master
+    @staticmethod
+    def _season(url):
+        # The season of a yearly file, which is also its partition in the local stats store
+        return int(re.search(r"(\d{4})\.csv$", url).group(1))
+
+    def _download_csv(self, url, tour_type):
+        # Conditional GET, the manifest holds the validators of the last download.
+        # A partition missing from the store (e.g. a rebuilt store) is always downloaded in full
+        record = self.manifest.get(url)
+        if record is not None and not os.path.exists(self.stats_store.partition_path(tour_type, self._season(url))):
+            record = None
+        headers = self.manifest.conditional_headers(url) if record is not None else {}
+        response = self.session.get(url, headers=headers, timeout=GITHUB_DOWNLOAD_TIMEOUT)
+        download = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "bytes": len(response.content),
+            "df": None,
+        }
+        if response.status_code == 304:
+            return download
+        response.raise_for_status()
+        download["content_hash"] = hashlib.sha256(response.content).hexdigest()
+        # Servers without validators still return the same content when nothing changed
+        if record is None or record["content_hash"] != download["content_hash"]:
+            download["df"] = pd.read_csv(io.BytesIO(response.content), sep=',', low_memory=False)
+        return download
+
+    def _download_and_update_url_content_in_local_repo(self, urls, tour_type):
+        # Download the files concurrently over the pooled session, then concatenate the changed files once in URL order
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            downloads = list(executor.map(lambda url: self._download_csv(url, tour_type), urls))
+        changed = [download for download in downloads if download["df"] is not None]
+
+        # Each yearly file is one partition of the local stats store, only the changed ones are replaced
+        changed_years = []
+        for download in changed:
+            year = self._season(download["url"])
+            row_count = self.stats_store.replace_partition(tour_type, year, download["df"])
+            self.manifest.record_changed(download["url"], tour_type, year, download["etag"], download["last_modified"], download["content_hash"], row_count)
+            changed_years.append(year)
+            print(f"Replaced '{tour_type}' {year} partition of the local stats store with {row_count} rows.")
+        for download in downloads:
+            if download["df"] is None:
+                self.manifest.record_unchanged(download["url"], download["etag"], download["last_modified"])
+
+        elapsed = time.perf_counter() - start
+        total_bytes = sum(download["bytes"] for download in downloads)
+        total_rows = sum(len(download["df"]) for download in changed)
+        if downloads:
+            print(f"Checked {len(downloads)} '{tour_type}' files, {len(changed)} changed: {total_bytes / 1e6:.1f} MB and {total_rows} rows "
+                  f"in {elapsed:.2f}s ({total_bytes / 1e6 / elapsed:.2f} MB/s, {total_rows / elapsed:.0f} rows/s).")
+        return sorted(changed_years)
 
     def download_github_tennis_data(self, filter_start_year):
-        repo_data_dict = {} # # Dictionary to store entire URL content {tour_type: DataFrame}
+        changed_years_dict = {} # Dictionary of the changed partitions {tour_type: [year]}
         # Iterate through each github repo and download tennis data
         for repo_name in self.list_repo_urls:
             tour_type = repo_name[-3:].lower()
-            url_local_repo_path = f"{self.repo_local}/{tour_type}_url_data.csv"
-            stat_local_repo_path = f"{self.repo_local}/{tour_type}_stat_data.csv"
 
             filtered_urls = self._extract_and_filter_csv_urls_from_github_repo(repo_name, filter_start_year)
-            new_urls, initial = self._update_url_archive_in_local_repo(filtered_urls,  url_local_repo_path)
-
-            # If there are no new URLs and it's not the initial run, do not update the local repository
-            if not initial and new_urls.empty:
-                print(f"No new URLs found containing '{tour_type}' data, local repo will not be updated.")
-                # Add an empty DataFrame for this tour_type
-                repo_data_dict[tour_type] = pd.DataFrame()
-                # Continue to next loop iteration
-                continue
 
-            # If it is the initial run, ensure the stats file exists
-            if initial and not os.path.exists(stat_local_repo_path):
-                pd.DataFrame().to_csv(stat_local_repo_path, sep=',', encoding='utf_8_sig', index=False)
+            # Every file is checked, new files and files changed since the last download are fetched in full
+            changed_years = self._download_and_update_url_content_in_local_repo(filtered_urls, tour_type)
+            changed_years_dict[tour_type] = changed_years
 
-            # If there are new URLs, download and print the content
-            if not new_urls.empty:
-                df_master = self._download_and_update_url_content_in_local_repo(new_urls, stat_local_repo_path)
-                repo_data_dict[tour_type] = df_master # Store url content in dictionary with tour type as key
-                print(df_master)
-                print(f"Updated local data archive with {repo_name} data.")
+            # If no file changed, the local repository was not updated
+            if not changed_years:
+                print(f"No new or changed URLs found containing '{tour_type}' data, local repo will not be updated.")
+                continue
 
-            # If initial run but no new URLs, still return True (repo initialized)
-            if initial:
-                print(f"Initialized local repo with '{tour_type}' data.")
+            print(f"Updated local data archive with {repo_name} data for {changed_years}.")
 
-        return repo_data_dict
+        return changed_years_dict
 
-    def upload_data_to_blob_storage(self, repo_data_dict):
-        for tour_type, data in repo_data_dict.items():
-            if data.empty:
+    def upload_data_to_blob_storage(self, changed_years_dict):
+        for tour_type, changed_years in changed_years_dict.items():
+            if not changed_years:
                 print(f"No new '{tour_type}' data found. Blob storage container '{self.container_client.container_name}' will not be updated.")
                 continue
+            # The blob is the agents' stats source, so it holds every year of the tour, read from the local stats store
+            stats = self.stats_store.read(tours=[tour_type]).drop(columns=["tour", "year"])
             filename = f"{tour_type}_stat_data.csv"
             blob_client = self.container_client.get_blob_client(filename)
-            blob_client.upload_blob(data.to_csv(index=False), overwrite=True)
-            print(f"Updated blob storage container '{self.container_client.container_name}' with '{tour_type}'. Uploaded '{filename}'.")
+            blob_client.upload_blob(stats.to_csv(index=False), overwrite=True)
+            print(f"Updated blob storage container '{self.container_client.container_name}' with '{tour_type}' ({len(stats)} rows, changed years {changed_years}). Uploaded '{filename}'.")
 
 # Usage example (can be called by a azure foundry agent tool)
 def main():
@@ -0,0 +1,72 @@
+"""
+SQLite manifest of the statistics files ingested from Github.
+- Stores the ETag, Last-Modified, content hash and row count of every downloaded URL.
+- Provides the conditional GET headers, so unchanged files are answered with 304 Not Modified.
+- Records each file only after its partition has been written, so an interrupted run downloads it again.
+"""
+
+from datetime import datetime, timezone
+import threading
+import sqlite3
+import os
+
+class IngestionManifest:
+    """
+    Class that handles the ingestion manifest of the statistics files.\n
+
+    path: The file path of the SQLite database.\n
+    """
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "url TEXT PRIMARY KEY, tour TEXT, year INTEGER, etag TEXT, last_modified TEXT, "
+            "content_hash TEXT, row_count INTEGER, checked_at TEXT, changed_at TEXT)"
+        )
+        self.connection.commit()
+
+    def get(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT url, tour, year, etag, last_modified, content_hash, row_count, checked_at, changed_at FROM files WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["url", "tour", "year", "etag", "last_modified", "content_hash", "row_count", "checked_at", "changed_at"], row))
+
+    def conditional_headers(self, url):
+        """Return the If-None-Match and If-Modified-Since headers for the last download of the URL."""
+        record = self.get(url)
+        headers = {}
+        if record is not None and record["content_hash"] is not None:
+            if record["etag"]:
+                headers["If-None-Match"] = record["etag"]
+            if record["last_modified"]:
+                headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def record_changed(self, url, tour, year, etag, last_modified, content_hash, row_count):
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (url, tour, year, etag, last_modified, content_hash, row_count, checked_at, changed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, tour, year, etag, last_modified, content_hash, row_count, now, now)
+            )
+            self.connection.commit()
+
+    def record_unchanged(self, url, etag=None, last_modified=None):
+        # Keep the stored validators when the response does not send new ones
+        with self.lock:
+            self.connection.execute(
+                "UPDATE files SET checked_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (datetime.now(timezone.utc).isoformat(), etag, last_modified, url)
+            )
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
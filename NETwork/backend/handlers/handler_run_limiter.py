@@ -0,0 +1,117 @@
+"""
+Limiter for running blocking agent conversations from the async FastAPI endpoints.
+- Runs each agent run on a bounded worker thread pool so the event loop is never blocked.
+- Caps the number of concurrent runs and the number of requests waiting for a worker.
+- Rejects requests once the wait queue is full so the endpoint can return 503 with Retry-After.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import math
+import time
+import os
+
+# Concurrency cap and wait queue length of the agent run worker pool
+AGENT_RUN_MAX_CONCURRENCY = int(os.getenv("AGENT_RUN_MAX_CONCURRENCY", "8"))
+AGENT_RUN_MAX_QUEUE = int(os.getenv("AGENT_RUN_MAX_QUEUE", "32"))
+
+# Retry-After (seconds) suggested before any run duration has been measured
+AGENT_RUN_RETRY_AFTER = int(os.getenv("AGENT_RUN_RETRY_AFTER", "5"))
+
+class AgentRunQueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Agent run queue is full, retry after {retry_after} seconds.")
+        self.retry_after = retry_after
+
+class AgentRunLimiter:
+    """
+    Class that runs blocking agent calls off the event loop with bounded concurrency.\n
+
+    max_concurrency: The maximum number of agent runs executing at once.\n
+    max_queue: The maximum number of requests waiting for a free worker.\n
+    retry_after: The Retry-After seconds suggested before run durations are known.\n
+    """
+    def __init__(self, max_concurrency=AGENT_RUN_MAX_CONCURRENCY, max_queue=AGENT_RUN_MAX_QUEUE, retry_after=AGENT_RUN_RETRY_AFTER):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent-run")
+        # Counters are only updated from the event loop thread, so they need no lock
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.average_run_seconds = None
+
+    def retry_after(self):
+        # Estimate how long the current backlog takes to drain at the measured run duration
+        if self.average_run_seconds is None:
+            return self.default_retry_after
+        rounds = (self.waiting + self.running) / self.max_concurrency
+        return max(1, math.ceil(self.average_run_seconds * rounds))
+
+    def _record_run(self, seconds):
+        if self.average_run_seconds is None:
+            self.average_run_seconds = seconds
+        else:
+            self.average_run_seconds = 0.8 * self.average_run_seconds + 0.2 * seconds
+
+    async def run(self, function, *args, **kwargs):
+        if self.running + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise AgentRunQueueFull(self.retry_after())
+
+        loop = asyncio.get_running_loop()
+        state = {"started_at": None}
+        self.waiting += 1
+
+        def start():
+            # Moves the request from waiting to running
+            state["started_at"] = time.perf_counter()
+            self.waiting -= 1
+            self.running += 1
+
+        def finish(future):
+            # Counts the run once its worker thread is free again, even when the awaiting request was cancelled
+            if state["started_at"] is None:
+                self.waiting -= 1
+                return
+            self.running -= 1
+            self._record_run(time.perf_counter() - state["started_at"])
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+        def call():
+            # Runs on a worker thread, the counters are updated on the event loop thread
+            loop.call_soon_threadsafe(start)
+            return function(*args, **kwargs)
+
+        def done(future):
+            try:
+                loop.call_soon_threadsafe(finish, future)
+            except RuntimeError:
+                # The event loop is already closed
+                pass
+
+        future = self.executor.submit(call)
+        future.add_done_callback(done)
+        # Cancelling the request only cancels a run that has not started, a started run keeps its worker
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "average_run_seconds": self.average_run_seconds,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
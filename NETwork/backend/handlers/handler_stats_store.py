@@ -0,0 +1,145 @@
+"""
+Columnar local store for the tennis match statistics.
+- Stores the matches as Parquet, partitioned by tour and year (tour=atp/year=2024/matches.parquet).
+  The year is the season of the source file, so each yearly file maps to exactly one partition.
+- Applies an explicit schema, with categorical (dictionary encoded) player names, surfaces and rounds.
+- Writes each partition atomically: the new file is written next to the old one and moved over it,
+  so readers never see a half written partition.
+- Reads with column pruning and partition filters, so queries and uploads only touch the years
+  and columns they need.
+"""
+
+import os
+import uuid
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Name of the Parquet file inside each partition directory
+PARTITION_FILE = "matches.parquet"
+
+# Marker file recording the partition key of the store, dataset discovery ignores files starting with an underscore
+LAYOUT_FILE = "_layout"
+LAYOUT = "year=source_file_season"
+
+# Categorical columns are dictionary encoded, so each name is stored once per file
+CATEGORICAL_COLUMNS = [
+    "tourney_name", "surface", "tourney_level", "round",
+    "winner_name", "winner_hand", "winner_ioc", "winner_entry",
+    "loser_name", "loser_hand", "loser_ioc", "loser_entry",
+]
+
+# Columns of the Sackmann match files and their types
+STATS_COLUMNS = (
+    [("tourney_id", pa.string()), ("tourney_name", pa.string()), ("surface", pa.string()), ("draw_size", pa.float64()),
+     ("tourney_level", pa.string()), ("tourney_date", pa.int64()), ("match_num", pa.int64())]
+    + [(f"{side}_{name}", type) for side in ["winner", "loser"] for name, type in [
+        ("id", pa.int64()), ("seed", pa.float64()), ("entry", pa.string()), ("name", pa.string()),
+        ("hand", pa.string()), ("ht", pa.float64()), ("ioc", pa.string()), ("age", pa.float64())]]
+    + [("score", pa.string()), ("best_of", pa.int64()), ("round", pa.string()), ("minutes", pa.float64())]
+    + [(f"{side}_{stat}", pa.float64()) for side in ["w", "l"] for stat in ["ace", "df", "svpt", "1stIn", "1stWon", "2ndWon", "SvGms", "bpSaved", "bpFaced"]]
+    + [(f"{side}_{stat}", pa.float64()) for side in ["winner", "loser"] for stat in ["rank", "rank_points"]]
+)
+
+# Explicit schema of the store
+STATS_SCHEMA = pa.schema([(name, pa.dictionary(pa.int32(), pa.string()) if name in CATEGORICAL_COLUMNS else type) for name, type in STATS_COLUMNS])
+
+# Convert a DataFrame of raw CSV matches to a table with the stats schema
+def to_stats_table(df):
+    missing = [name for name in STATS_SCHEMA.names if name not in df.columns]
+    if missing:
+        print(f"Columns missing from the match data are stored as nulls: {missing}")
+    df = df.reindex(columns=STATS_SCHEMA.names)
+    for field in STATS_SCHEMA:
+        if pa.types.is_dictionary(field.type) or pa.types.is_string(field.type):
+            # Keep the values as text, missing values stay null
+            df[field.name] = df[field.name].astype("object").where(df[field.name].notna(), None)
+            df[field.name] = df[field.name].map(lambda value: value if value is None else str(value))
+        else:
+            df[field.name] = pd.to_numeric(df[field.name], errors="coerce")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return pa.table([table[field.name].cast(field.type) for field in STATS_SCHEMA], schema=STATS_SCHEMA)
+
+class StatsParquetStore:
+    """
+    Class that handles the partitioned Parquet store of tennis match statistics.\n
+
+    root: The directory path of the store.\n
+    """
+    def __init__(self, root):
+        self.root = root
+        self._check_layout()
+
+    def _check_layout(self):
+        # Stores written before the partition key was the source file season are rebuilt from scratch,
+        # a partition of that layout can hold matches of two yearly files
+        layout_path = os.path.join(self.root, LAYOUT_FILE)
+        if os.path.exists(layout_path):
+            with open(layout_path) as f:
+                if f.read().strip() == LAYOUT:
+                    return
+        for tour_dir in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            if tour_dir.startswith("tour="):
+                shutil.rmtree(os.path.join(self.root, tour_dir))
+                print(f"Removed '{tour_dir}' from the stats store, it was written with an older partition layout.")
+        os.makedirs(self.root, exist_ok=True)
+        with open(layout_path, "w") as f:
+            f.write(LAYOUT)
+
+    def partition_path(self, tour, year):
+        return os.path.join(self.root, f"tour={tour}", f"year={int(year)}", PARTITION_FILE)
+
+    def partitions(self, tour=None):
+        """Return the (tour, year) partitions in the store."""
+        partitions = []
+        if not os.path.isdir(self.root):
+            return partitions
+        for tour_dir in sorted(os.listdir(self.root)):
+            if not tour_dir.startswith("tour=") or (tour is not None and tour_dir != f"tour={tour}"):
+                continue
+            for year_dir in sorted(os.listdir(os.path.join(self.root, tour_dir))):
+                if year_dir.startswith("year=") and os.path.exists(os.path.join(self.root, tour_dir, year_dir, PARTITION_FILE)):
+                    partitions.append((tour_dir[len("tour="):], int(year_dir[len("year="):])))
+        return partitions
+
+    def _write_partition(self, tour, year, table):
+        # Write to a temporary file in the partition directory, then atomically move it into place
+        path = self.partition_path(tour, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Dataset discovery ignores files starting with a dot, so readers never pick up the temporary file
+        tmp_path = os.path.join(os.path.dirname(path), f".{PARTITION_FILE}.{uuid.uuid4().hex}.tmp")
+        try:
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def replace_partition(self, tour, year, df):
+        """Replace the partition with the matches of df, the yearly source file of that season."""
+        table = to_stats_table(df)
+        self._write_partition(tour, year, table)
+        return table.num_rows
+
+    def dataset(self):
+        return ds.dataset(self.root, format="parquet", partitioning="hive", schema=STATS_SCHEMA.append(pa.field("tour", pa.string())).append(pa.field("year", pa.int32())))
+
+    def read_table(self, tours=None, years=None, columns=None):
+        """Read the matches as an Arrow table, only scanning the requested tours, years and columns."""
+        if not self.partitions():
+            table = STATS_SCHEMA.empty_table()
+            return table.select(columns) if columns else table
+        dataset = self.dataset()
+        expression = None
+        if tours is not None:
+            expression = ds.field("tour").isin(list(tours))
+        if years is not None:
+            year_filter = ds.field("year").isin([int(year) for year in years])
+            expression = year_filter if expression is None else expression & year_filter
+        return dataset.to_table(columns=columns, filter=expression)
+
+    def read(self, tours=None, years=None, columns=None):
+        """Read the matches as a DataFrame, categorical columns are returned as pandas categoricals."""
+        return self.read_table(tours, years, columns).to_pandas()
@@ -0,0 +1,182 @@
+"""
+Lifecycle manager for agent conversation threads.
+- Records when each thread served by this process was created and last used.
+- Expires threads that have been idle for longer than the TTL, including threads left over
+  from earlier processes, which are found by listing the project threads oldest first.
+- Checks the newest message of every candidate right before deleting it, so a thread used by another
+  worker or before a restart is kept while it is still in use.
+- Checks and deletes the candidates in bounded-concurrency batches, without fetching each thread first.
+- Makes its Foundry calls at background priority, so they yield to chat requests.
+- Runs as a background task of the FastAPI app and reports the deletion rate and backlog.
+"""
+
+from azure.ai.agents.models import ListSortOrder
+from handlers.handler_foundry_scheduler import BACKGROUND
+from datetime import datetime, timezone
+import threading
+import asyncio
+import time
+import os
+
+# Threads idle for longer than this many seconds are deleted
+THREAD_TTL_SECONDS = int(os.getenv("THREAD_TTL_SECONDS", str(24 * 60 * 60)))
+
+# Seconds between two garbage collection sweeps
+THREAD_GC_INTERVAL = int(os.getenv("THREAD_GC_INTERVAL", "300"))
+
+# Number of threads deleted per batch and number of concurrent deletes within a batch
+THREAD_GC_BATCH_SIZE = int(os.getenv("THREAD_GC_BATCH_SIZE", "100"))
+THREAD_GC_MAX_CONCURRENCY = int(os.getenv("THREAD_GC_MAX_CONCURRENCY", "8"))
+
+class ThreadLifecycleManager:
+    """
+    Class that handles the expiry and deletion of idle conversation threads.\n
+
+    handler: The AgentConversationHandler used to list and delete threads.\n
+    ttl: The number of idle seconds after which a thread expires.\n
+    interval: The number of seconds between two sweeps of the background task.\n
+    batch_size: The number of threads deleted per batch.\n
+    max_concurrency: The maximum number of concurrent deletes within a batch.\n
+    """
+    def __init__(self, handler, ttl=THREAD_TTL_SECONDS, interval=THREAD_GC_INTERVAL, batch_size=THREAD_GC_BATCH_SIZE, max_concurrency=THREAD_GC_MAX_CONCURRENCY):
+        self.handler = handler
+        self.ttl = ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.lock = threading.Lock()
+        # thread_id -> {"created_at", "last_used_at"}, as epoch seconds
+        self.threads = {}
+        self.backlog = 0
+        self.deleted = 0
+        self.failed = 0
+        self.sweeps = 0
+        self.last_sweep = None
+
+    def touch(self, thread_id):
+        """Record that the thread was used now."""
+        if thread_id is None:
+            return
+        now = time.time()
+        with self.lock:
+            entry = self.threads.setdefault(thread_id, {"created_at": now, "last_used_at": now})
+            entry["last_used_at"] = now
+
+    def forget(self, thread_id):
+        with self.lock:
+            self.threads.pop(thread_id, None)
+
+    @staticmethod
+    def _timestamp(value):
+        return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+
+    def last_activity(self, thread_id, default):
+        """Return the time of the newest message of the thread, or default when it has no messages."""
+        messages = self.handler.project.agents.messages.list(thread_id=thread_id, order=ListSortOrder.DESCENDING, limit=1)
+        for message in self.handler.scheduler.paged("messages.list", messages):
+            return self._timestamp(message.created_at) if message.created_at else default
+        return default
+
+    def expiry_candidates(self, now=None, scan_project=True):
+        """
+        Return {thread_id: last known use} for the threads that may have been idle for longer than the TTL.
+        Untracked threads use their creation time, the newest message decides when they are deleted.
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.ttl
+        with self.lock:
+            last_used = {thread_id: entry["last_used_at"] for thread_id, entry in self.threads.items()}
+        candidates = {thread_id: used_at for thread_id, used_at in last_used.items() if used_at < cutoff}
+
+        if scan_project:
+            # Oldest first, so listing stops at the first thread created after the cutoff
+            threads = self.handler.project.agents.threads.list(order=ListSortOrder.ASCENDING)
+            with self.handler.scheduler.priority(BACKGROUND):
+                for thread in self.handler.scheduler.paged("threads.list", threads):
+                    created_at = self._timestamp(thread.created_at)
+                    if created_at >= cutoff:
+                        break
+                    # Threads used recently by this process are kept even if they were created long ago
+                    if thread.id in candidates or last_used.get(thread.id, created_at) >= cutoff:
+                        continue
+                    candidates[thread.id] = created_at
+        return candidates
+
+    def _is_expired(self, thread_id, used_at, cutoff):
+        # Last use is only known to the process that served the thread, so the newest message
+        # decides, it also covers threads used by other workers or before a restart
+        active_at = self.last_activity(thread_id, used_at)
+        if active_at < cutoff:
+            return True
+        with self.lock:
+            # Used by another worker, so the local record is moved forward
+            if thread_id in self.threads:
+                self.threads[thread_id]["last_used_at"] = max(self.threads[thread_id]["last_used_at"], active_at)
+        return False
+
+    def collect(self, scan_project=True):
+        """Check and delete the expiry candidates in batches and return the sweep statistics."""
+        start = time.perf_counter()
+        cutoff = time.time() - self.ttl
+        candidates = self.expiry_candidates(now=cutoff + self.ttl, scan_project=scan_project)
+        thread_ids = list(candidates)
+        self.backlog = len(thread_ids)
+        deleted = failed = kept = 0
+
+        for i in range(0, len(thread_ids), self.batch_size):
+            batch = thread_ids[i:i + self.batch_size]
+            batch_deleted, batch_failed = self.handler.delete_threads(
+                batch,
+                max_workers=self.max_concurrency,
+                priority=BACKGROUND,
+                should_delete=lambda thread_id: self._is_expired(thread_id, candidates[thread_id], cutoff)
+            )
+            for thread_id in batch_deleted:
+                self.forget(thread_id)
+            deleted += len(batch_deleted)
+            failed += len(batch_failed)
+            kept += len(batch) - len(batch_deleted) - len(batch_failed)
+            self.backlog = len(thread_ids) - min(i + self.batch_size, len(thread_ids)) + failed
+            with self.lock:
+                self.deleted += len(batch_deleted)
+                self.failed += len(batch_failed)
+
+        elapsed = time.perf_counter() - start
+        self.backlog = failed
+        self.sweeps += 1
+        self.last_sweep = {
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "candidates": len(thread_ids),
+            "kept": kept,
+            "deleted": deleted,
+            "failed": failed,
+            "seconds": elapsed,
+            "deleted_per_second": deleted / elapsed if elapsed else 0.0,
+        }
+        if thread_ids:
+            print(f"Thread GC deleted {deleted} of {len(thread_ids)} candidate threads in {elapsed:.2f}s "
+                  f"({self.last_sweep['deleted_per_second']:.1f} threads/sec, {kept} still in use, {failed} failed)")
+        return self.last_sweep
+
+    async def run(self):
+        """Sweep every interval seconds until the task is cancelled."""
+        while True:
+            try:
+                await asyncio.to_thread(self.collect)
+            except Exception as e:
+                print("Thread GC sweep failed:", e)
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        with self.lock:
+            tracked = len(self.threads)
+        return {
+            "ttl_seconds": self.ttl,
+            "interval_seconds": self.interval,
+            "tracked_threads": tracked,
+            "backlog": self.backlog,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "sweeps": self.sweeps,
+            "last_sweep": self.last_sweep,
+        }
@@ -0,0 +1,95 @@
+"""
+Local cache of agent conversation thread transcripts.
+- Keeps the text messages of recently used threads in memory, oldest first.
+- Syncs a thread incrementally: messages are listed newest first and listing stops at the
+  last message already cached, so only new messages are paged from the Foundry endpoint.
+- Evicts the least recently used threads once the cache holds too many.
+"""
+
+from azure.ai.agents.models import ListSortOrder
+from collections import OrderedDict
+import threading
+import os
+
+# Maximum number of thread transcripts kept in memory
+THREAD_TRANSCRIPT_CACHE_SIZE = int(os.getenv("THREAD_TRANSCRIPT_CACHE_SIZE", "256"))
+
+# Convert a thread message to a transcript entry
+def transcript_entry(message):
+    return {
+        "id": message.id,
+        "role": str(message.role),
+        "content": "\n".join(text.text.value for text in message.text_messages),
+        "run_id": message.run_id,
+        "created_at": message.created_at.isoformat() if message.created_at else None,
+    }
+
+class ThreadTranscriptCache:
+    """
+    Class that handles the incremental retrieval of thread messages.\n
+
+    project: The AI project client used to list the thread messages.\n
+    scheduler: The FoundryCallScheduler the list calls go through.\n
+    max_threads: The maximum number of thread transcripts kept in memory.\n
+    """
+    def __init__(self, project, scheduler, max_threads=THREAD_TRANSCRIPT_CACHE_SIZE):
+        self.project = project
+        self.scheduler = scheduler
+        self.max_threads = max_threads
+        self.transcripts = OrderedDict()
+        self.lock = threading.Lock()
+        self.thread_locks = {}
+        self.synced_messages = 0
+        self.full_syncs = 0
+
+    def _thread_lock(self, thread_id):
+        with self.lock:
+            return self.thread_locks.setdefault(thread_id, threading.Lock())
+
+    def sync(self, thread_id):
+        """Fetch the messages added since the last sync and return the full transcript."""
+        with self._thread_lock(thread_id):
+            with self.lock:
+                transcript = self.transcripts.get(thread_id, [])
+            last_seen_id = transcript[-1]["id"] if transcript else None
+
+            # The pager fetches pages lazily, so stopping at the last seen message stops the paging too
+            new_messages = []
+            found = last_seen_id is None
+            messages = self.project.agents.messages.list(thread_id=thread_id, order=ListSortOrder.DESCENDING)
+            for message in self.scheduler.paged("messages.list", messages):
+                if message.id == last_seen_id:
+                    found = True
+                    break
+                new_messages.append(transcript_entry(message))
+            new_messages.reverse()
+
+            if found:
+                transcript = transcript + new_messages
+            else:
+                # The last seen message is gone (e.g. deleted), the listing covered the whole thread
+                transcript = new_messages
+                self.full_syncs += 1
+
+            with self.lock:
+                self.synced_messages += len(new_messages)
+                self.transcripts[thread_id] = transcript
+                self.transcripts.move_to_end(thread_id)
+                while len(self.transcripts) > self.max_threads:
+                    evicted, _ = self.transcripts.popitem(last=False)
+                    self.thread_locks.pop(evicted, None)
+            return list(transcript)
+
+    def forget(self, thread_id):
+        with self.lock:
+            self.transcripts.pop(thread_id, None)
+            self.thread_locks.pop(thread_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "threads": len(self.transcripts),
+                "messages": sum(len(transcript) for transcript in self.transcripts.values()),
+                "synced_messages": self.synced_messages,
+                "full_syncs": self.full_syncs,
+            }
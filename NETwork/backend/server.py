@@ -4,6 +4,23 @@ This script sets up a FastAPI application for the NETwork project.
 - Entry point for running the FastAPI backend server.
 - Enables CORS to allow requests from the frontend (e.g., http://localhost:3000).
 - Imports and uses the agent_conversation handler for processing chat requests.
+- Creates one AgentConversationHandler for the lifetime of the app and warms it up at startup,
+  so requests share the cached token, pooled connections and connect agent.
+- Runs the blocking agent conversation on a bounded worker pool so the event loop stays free,
+  and returns 503 with Retry-After when the wait queue is full.
+- Continues a conversation whose thread was deleted (e.g. by the thread garbage collector) in a new
+  thread, the response carries the new thread ID.
+- Exposes a POST endpoint at /api/generate_response_stream that streams the agent run as
+  server-sent events (thread ID first, then run step progress and text deltas).
+- Exposes a GET endpoint at /api/threads/{thread_id}/messages that returns the thread transcript,
+  synced incrementally from the last message already seen.
+- Runs a background task that deletes threads idle for longer than THREAD_TTL_SECONDS,
+  with its deletion rate and backlog reported at /api/thread_stats.
+- Answers the first turn of new chats from a cache tied to the statistics data version, and
+  coalesces identical first prompts that arrive together into one agent run.
+- Offers a job mode for long runs: POST /api/jobs queues a conversation turn and returns a job ID
+  at once, GET /api/jobs/{job_id}?wait=N polls or long-polls for the result and DELETE cancels it.
+- Reports the Foundry call scheduler's per-endpoint throttle and retry counters at /api/foundry_stats.
 - Exposes a POST endpoint at /api/agent that receives JSON data from the frontend,
   passes it to the agent_conversation function, and returns the response.
 """
@@ -11,20 +28,87 @@ This script sets up a FastAPI application for the NETwork project.
 
 import sys
 import os
+import json
+import time
+import asyncio
+import threading
 
 # Add the current directory to the system path to allow imports from utils
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from handlers.handler_agent_conversation import AgentConversationHandler
+from fastapi.responses import JSONResponse, StreamingResponse
+from handlers.handler_agent_conversation import AgentConversationHandler, RUN_FAILED_PREFIX, is_thread_not_found
+from handlers.handler_first_turn_cache import FirstTurnCache, first_turn_prompt
+from handlers.handler_run_limiter import AgentRunLimiter, AgentRunQueueFull
+from handlers.handler_thread_lifecycle import ThreadLifecycleManager
+from handlers.handler_agent_jobs import AgentJobQueue, AgentJobQueueFull
 
 # Load environment variable for allowed origins
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
 
+# Create the shared handler at startup and warm it up before the first user request
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.handler = AgentConversationHandler()
+    app.state.run_limiter = AgentRunLimiter()
+    try:
+        await run_in_threadpool(app.state.handler.warm_up)
+    except Exception as e:
+        # The token and agent are fetched lazily on the first request instead
+        print("Foundry warm-up failed:", e)
+    # Delete idle threads in the background for as long as the app runs
+    app.state.thread_lifecycle = ThreadLifecycleManager(app.state.handler)
+    thread_gc_task = asyncio.create_task(app.state.thread_lifecycle.run())
+    app.state.first_turn_cache = FirstTurnCache()
+    # Process queued jobs with the same conversation logic as /api/generate_response
+    app.state.job_queue = AgentJobQueue(lambda contents, thread, cancel_event: answer_conversation(app, contents, thread, retry_when_full=True, cancel_event=cancel_event))
+    app.state.job_queue.start()
+    yield
+    await app.state.job_queue.stop()
+    thread_gc_task.cancel()
+    app.state.first_turn_cache.data_version.close()
+    app.state.run_limiter.shutdown()
+    app.state.handler.close()
+
+# Only complete answers of successful runs are cached
+def is_cacheable_response(response):
+    return isinstance(response, str) and bool(response) and not response.startswith(RUN_FAILED_PREFIX)
+
+# Answer a conversation turn and return (response, thread_id)
+# Set retry_when_full to wait for room on the agent run worker pool instead of raising AgentRunQueueFull
+# Setting cancel_event (a threading.Event) stops the agent run and cancels it on Foundry
+async def answer_conversation(app, contents, thread=None, retry_when_full=False, cancel_event=None):
+    handler = app.state.handler
+    run_limiter = app.state.run_limiter
+    while True:
+        try:
+            prompt = first_turn_prompt(contents) if thread is None else None
+            if prompt:
+                # Answer the first turn of a new chat from the cache, or share a run with identical prompts
+                response, new_thread = await app.state.first_turn_cache.answer(
+                    prompt,
+                    run=lambda: run_limiter.run(handler.agent_conversation, contents, cancel_event=cancel_event),
+                    replay=lambda answer: run_in_threadpool(handler.replay_conversation, contents, answer),
+                    cacheable=is_cacheable_response
+                )
+            else:
+                # Call the agent conversation function on the worker pool
+                response, new_thread = await run_limiter.run(handler.agent_conversation, contents, thread=thread, cancel_event=cancel_event)
+            break
+        except AgentRunQueueFull as e:
+            if not retry_when_full:
+                raise
+            await asyncio.sleep(e.retry_after)
+    thread_id = getattr(new_thread, "id", None)
+    app.state.thread_lifecycle.touch(thread_id)
+    return response, thread_id
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for local frontend
 app.add_middleware(
@@ -39,15 +123,19 @@ app.add_middleware(
 @app.post("/api/generate_response")
 async def generate_response(request: Request):
     try:
-        # Create an instance of the handler
-        handler = AgentConversationHandler()
         # Get data elements from request
         data = await request.json()
         contents = data["contents"]
         thread = data.get("thread_id")
-        # Call the agent conversation function
-        response, thread = handler.agent_conversation(contents, thread=thread)
-        return {"response": response, "thread_id": getattr(thread, "id", None)}
+        # Answer with the shared handler created at startup
+        response, thread_id = await answer_conversation(request.app, contents, thread)
+        return {"response": response, "thread_id": thread_id}
+    except AgentRunQueueFull as e:
+        return JSONResponse(
+            status_code=503,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         import traceback
         print("Error in /api/generate_response:", e)
@@ -56,3 +144,191 @@ async def generate_response(request: Request):
             status_code=500,
             content={"error": str(e)}
         )
+
+# Create post endpoint that queues an agent conversation turn as a job
+@app.post("/api/jobs")
+async def create_job(request: Request):
+    try:
+        data = await request.json()
+        job = request.app.state.job_queue.submit(data["contents"], data.get("thread_id"))
+        return JSONResponse(status_code=202, content=job.to_dict())
+    except AgentJobQueueFull as e:
+        return JSONResponse(
+            status_code=503,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+# Create get endpoint for the state of a job, set wait to long-poll until it finishes
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, request: Request, wait: float = 0):
+    job_queue = request.app.state.job_queue
+    job = await job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"No job found with id {job_id}"})
+    return job.to_dict()
+
+# Create delete endpoint that cancels a job
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str, request: Request):
+    job = request.app.state.job_queue.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"No job found with id {job_id}"})
+    return job.to_dict()
+
+# Create get endpoint for the job queue statistics
+@app.get("/api/job_stats")
+async def job_stats(request: Request):
+    return request.app.state.job_queue.stats()
+
+# Tasks bridging the streaming runs from the worker pool to the event loop
+stream_tasks = set()
+
+# Format an event dict as a server-sent event
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+# Create post endpoint for the streaming agent conversation
+@app.post("/api/generate_response_stream")
+async def generate_response_stream(request: Request):
+    try:
+        handler = request.app.state.handler
+        data = await request.json()
+        contents = data["contents"]
+        thread = data.get("thread_id")
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    # A cached first-turn answer is written into a new thread and sent as a single delta
+    first_turn_cache = request.app.state.first_turn_cache
+    prompt = first_turn_prompt(contents) if thread is None else None
+    if prompt:
+        await first_turn_cache.check_version()
+    cached = first_turn_cache.lookup(prompt) if prompt else None
+    if cached is not None:
+        first_turn_cache.hits += 1
+        try:
+            new_thread = await run_in_threadpool(handler.replay_conversation, contents, cached)
+        except Exception as e:
+            print("Error in /api/generate_response_stream:", e)
+            return JSONResponse(status_code=500, content={"error": str(e)})
+        request.app.state.thread_lifecycle.touch(new_thread.id)
+        events = [
+            {"type": "thread", "thread_id": new_thread.id},
+            {"type": "delta", "text": cached},
+            {"type": "done", "response": cached},
+        ]
+        return StreamingResponse(
+            (format_sse(event) for event in events),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def pump():
+        # Runs on a worker thread and hands each event over to the event loop
+        start = time.perf_counter()
+        first_token = True
+        events = handler.stream_agent_conversation(contents, thread=thread)
+        try:
+            for event in events:
+                if first_token and event["type"] == "delta":
+                    first_token = False
+                    print(f"Time to first token: {time.perf_counter() - start:.2f}s")
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+                if stop.is_set():
+                    break
+        finally:
+            events.close()
+
+    async def run():
+        # The stream holds a worker for the whole run, so it counts against the same cap
+        try:
+            await request.app.state.run_limiter.run(pump)
+        except Exception as e:
+            queue.put_nowait(e)
+        finally:
+            queue.put_nowait(None)
+
+    # Keep a reference so the task is not garbage collected while the run finishes
+    task = asyncio.create_task(run())
+    stream_tasks.add(task)
+    task.add_done_callback(stream_tasks.discard)
+
+    # Errors raised before the first event are returned as a normal JSON response
+    first = await queue.get()
+    if isinstance(first, AgentRunQueueFull):
+        return JSONResponse(
+            status_code=503,
+            content={"error": str(first)},
+            headers={"Retry-After": str(first.retry_after)}
+        )
+    if isinstance(first, Exception):
+        print("Error in /api/generate_response_stream:", first)
+        return JSONResponse(status_code=500, content={"error": str(first)})
+
+    async def event_stream():
+        item = first
+        try:
+            while item is not None:
+                if isinstance(item, Exception):
+                    print("Error in /api/generate_response_stream:", item)
+                    item = {"type": "error", "error": str(item)}
+                elif item["type"] == "thread":
+                    request.app.state.thread_lifecycle.touch(item["thread_id"])
+                elif item["type"] == "done" and prompt and is_cacheable_response(item["response"]):
+                    first_turn_cache.store(prompt, item["response"])
+                yield format_sse(item)
+                item = await queue.get()
+        finally:
+            # Stops the worker when the client disconnects before the run ends
+            stop.set()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Create get endpoint for the transcript of a conversation thread
+@app.get("/api/threads/{thread_id}/messages")
+async def thread_messages(thread_id: str, request: Request):
+    try:
+        handler = request.app.state.handler
+        messages = await run_in_threadpool(handler.get_transcript, thread_id)
+        return {"thread_id": thread_id, "messages": messages}
+    except Exception as e:
+        if is_thread_not_found(e):
+            return JSONResponse(status_code=404, content={"error": f"No thread found with id {thread_id}"})
+        print("Error in /api/threads/{thread_id}/messages:", e)
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+# Create get endpoint for the first-turn answer cache statistics
+@app.get("/api/first_turn_cache_stats")
+async def first_turn_cache_stats(request: Request):
+    return request.app.state.first_turn_cache.stats()
+
+# Create get endpoint for the thread garbage collector statistics
+@app.get("/api/thread_stats")
+async def thread_stats(request: Request):
+    return request.app.state.thread_lifecycle.stats()
+
+# Create get endpoint for the Foundry call scheduler statistics
+@app.get("/api/foundry_stats")
+async def foundry_stats(request: Request):
+    return request.app.state.handler.scheduler.stats()
+
+# Create get endpoint for the agent run worker pool statistics
+@app.get("/api/run_stats")
+async def run_stats(request: Request):
+    stats = request.app.state.run_limiter.stats()
+    stats["transcripts"] = request.app.state.handler.transcripts.stats()
+    return stats
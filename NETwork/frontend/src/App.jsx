@@ -2,6 +2,7 @@
  * Main App component for NETwork.
  * - Manages theme, sidebar state, conversations, and active chat.
  * - Handles message typing effect, API calls, and localStorage persistence.
+ * - Streams agent replies from the server-sent events endpoint when it is configured.
  * - Renders sidebar, chat messages, prompt input, and welcome screen.
  */
 
@@ -20,6 +21,23 @@ const REACT_APP_GENERATE_RESPONSE_ENDPOINT =
     ? process.env.REACT_APP_GENERATE_RESPONSE_ENDPOINT_PROD
     : process.env.REACT_APP_GENERATE_RESPONSE_ENDPOINT_DEV;
 
+// Define the backend API endpoint for streaming a response (optional)
+const REACT_APP_GENERATE_RESPONSE_STREAM_ENDPOINT =
+  process.env.NODE_ENV === "production"
+    ? process.env.REACT_APP_GENERATE_RESPONSE_STREAM_ENDPOINT_PROD
+    : process.env.REACT_APP_GENERATE_RESPONSE_STREAM_ENDPOINT_DEV;
+
+// Parse one server-sent event block into its event name and JSON data
+const parseServerSentEvent = (block) => {
+  let event = "message";
+  const data = [];
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+  }
+  return data.length ? { event, data: JSON.parse(data.join("\n")) } : null;
+};
+
 const App = () => {
   // State
   const [isLoading, setIsLoading] = useState(false);
@@ -122,6 +140,11 @@ const App = () => {
   };
 
 const generateResponse = async (conversation, botMessageId) => {
+  // Use the streaming endpoint when it is configured
+  if (REACT_APP_GENERATE_RESPONSE_STREAM_ENDPOINT) {
+    return generateStreamingResponse(conversation, botMessageId);
+  }
+
   // Format messages for the API request
   const formattedMessages = conversation.messages?.map((msg) => ({
     role: msg.role === "bot" ? "assistant" : msg.role,
@@ -160,6 +183,72 @@ const generateResponse = async (conversation, botMessageId) => {
   }
 };
 
+const generateStreamingResponse = async (conversation, botMessageId) => {
+  // Format messages for the API request
+  const formattedMessages = conversation.messages?.map((msg) => ({
+    role: msg.role === "bot" ? "assistant" : msg.role,
+    content: msg.content,
+  }));
+  try {
+    // Make a POST request to the streaming API backend endpoint
+    const res = await fetch(REACT_APP_GENERATE_RESPONSE_STREAM_ENDPOINT, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+      body: JSON.stringify({ contents: formattedMessages, thread_id: conversation.thread_id || null }),
+    });
+    // Errors raised before the stream starts come back as JSON
+    if (!res.ok) {
+      const data = await res.json().catch(() => ({}));
+      throw new Error(data.error || "API error");
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let responseText = "";
+    let finished = false;
+
+    while (!finished) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      // Events are separated by a blank line, keep the incomplete tail in the buffer
+      const blocks = buffer.split("\n\n");
+      buffer = blocks.pop();
+      for (const block of blocks) {
+        const message = parseServerSentEvent(block);
+        if (!message) continue;
+        const { event, data } = message;
+        if (event === "thread") {
+          // Update the conversation state with the thread ID sent in the first event
+          setConversations((prev) =>
+            prev.map((conv) =>
+              conv.id === conversation.id
+              ? { ...conv, thread_id: data.thread_id }
+              : conv
+            )
+          );
+        } else if (event === "delta") {
+          // Show the reply as it is generated
+          responseText += data.text;
+          updateBotMessage(botMessageId, responseText);
+          scrollToBottom();
+        } else if (event === "done") {
+          responseText = data.response || responseText;
+          finished = true;
+        } else if (event === "error") {
+          throw new Error(data.error || "API error");
+        }
+      }
+    }
+
+    displayBotMessage(responseText.trim() || "No response from agent.", botMessageId); // Display the full response
+  } catch (error) {
+    setIsLoading(false); // Stop loading state
+    updateBotMessage(botMessageId, error.message, true); // Update the bot message with the error
+  }
+};
+
   // Render
   return (
     <div className={`app-container ${theme === "light" ? "light-theme" : "dark-theme"}`}>
@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+import numpy as np
+
+# Semantic answer cache for respond_to_question
+# A question is answered from the cache when its embedding is within the cosine
+# similarity threshold of a previously answered question
+answer_cache_threshold = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+answer_cache_ttl = float(os.getenv('ANSWER_CACHE_TTL', '86400'))
+answer_cache_max_entries = int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000'))
+
+
+class SemanticAnswerCache:
+    """
+    Size bounded, TTL expiring cache of answers keyed by question embedding.
+
+    threshold: Minimum cosine similarity for a cached answer to be reused.
+    ttl: Seconds before a cached answer expires.
+    max_entries: Maximum number of answers kept, least recently used answers are evicted first.
+    """
+
+    def __init__(self, threshold=answer_cache_threshold, ttl=answer_cache_ttl, max_entries=answer_cache_max_entries):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = []
+        self.matrix = None
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def _normalize(self, embedding):
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+
+        return vector / norm if norm else vector
+
+    # Drop expired entries and rebuild the embedding matrix from the survivors
+    def _remove(self, keep):
+
+        self.entries = [self.entries[i] for i in keep]
+        self.matrix = self.matrix[keep] if self.entries else None
+
+    def _expire(self, now):
+
+        keep = [i for i, entry in enumerate(self.entries) if now - entry["created"] < self.ttl]
+        if len(keep) != len(self.entries):
+            self._remove(keep)
+
+    # Returns the cached answer for the closest previous question, or None
+    def lookup(self, embedding):
+
+        now = time.time()
+        query = self._normalize(embedding)
+
+        with self.lock:
+
+            self._expire(now)
+
+            if self.matrix is not None and self.matrix.shape[1] == query.shape[0]:
+
+                scores = self.matrix @ query
+                best = int(np.argmax(scores))
+
+                if scores[best] >= self.threshold:
+                    entry = self.entries[best]
+                    entry["last_used"] = now
+                    self.hits += 1
+                    self.seconds_saved += entry["seconds"]
+                    return entry["answer"]
+
+            self.misses += 1
+
+        return None
+
+    # seconds is how long the answer took to produce, reported as latency saved on later hits
+    def store(self, question, embedding, answer, seconds=0.0):
+
+        now = time.time()
+        vector = self._normalize(embedding)
+
+        with self.lock:
+
+            self.entries.append({"question": question, "answer": answer, "created": now, "last_used": now, "seconds": seconds})
+            self.matrix = vector[None, :] if self.matrix is None else np.vstack([self.matrix, vector])
+
+            if len(self.entries) > self.max_entries:
+                order = sorted(range(len(self.entries)), key=lambda i: self.entries[i]["last_used"])
+                self._remove(sorted(order[len(self.entries) - self.max_entries:]))
+
+    def clear(self):
+
+        with self.lock:
+            self.entries = []
+            self.matrix = None
+
+    # Invalidation hook, cached answers are dropped whenever the index version changes
+    def set_index_version(self, version):
+
+        with self.lock:
+            changed = version != self.index_version
+            self.index_version = version
+
+        if changed:
+            self.clear()
+
+        return changed
+
+    def stats(self):
+
+        with self.lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": self.seconds_saved,
+                "index_version": self.index_version,
+            }
@@ -0,0 +1,79 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+# Shared, lazily initialized API clients for the Ten-AI modules
+# Each client is created on first use and reused by every module, so importing a module
+# never opens a connection and every request reuses the same pooled HTTP connections
+load_dotenv()
+
+index_name = 'tennis-glossary'
+
+# Retrieval backend, either 'pinecone' (remote index) or 'local' (in-process NumPy index loaded from a snapshot)
+retrieval_backend = os.getenv('RETRIEVAL_BACKEND', 'pinecone').lower()
+
+# Connection pool sizes, should be at least the number of concurrent requests served by the app
+http_max_connections = int(os.getenv('HTTP_MAX_CONNECTIONS', '20'))
+pinecone_pool_threads = int(os.getenv('PINECONE_POOL_THREADS', '8'))
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_client(name, factory):
+
+    client = clients.get(name)
+
+    if client is None:
+        with clients_lock:
+            client = clients.get(name)
+            if client is None:
+                client = clients[name] = factory()
+
+    return client
+
+
+# Replace a client, e.g. with a local stand-in for tests and benchmarks
+def set_client(name, client):
+
+    with clients_lock:
+        clients[name] = client
+
+
+def reset_clients():
+
+    with clients_lock:
+        clients.clear()
+
+
+def create_openai():
+
+    from openai import OpenAI, DefaultHttpxClient
+    import httpx
+
+    return OpenAI(http_client=DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=http_max_connections, max_keepalive_connections=http_max_connections)
+    ))
+
+
+def create_pinecone():
+
+    from pinecone import Pinecone
+
+    return Pinecone(api_key=os.getenv('PINECONE_API_KEY'), pool_threads=pinecone_pool_threads)
+
+
+def get_openai():
+
+    return get_client('openai', create_openai)
+
+
+def get_pinecone():
+
+    return get_client('pinecone', create_pinecone)
+
+
+# Index handles hold their own connection pool, so one handle is kept per index
+def get_pinecone_index(name=index_name):
+
+    return get_client(f'pinecone-index:{name}', lambda: get_pinecone().Index(name))
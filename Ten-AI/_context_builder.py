@@ -0,0 +1,116 @@
+import os
+import numpy as np
+from _embed_chunks import estimate_tokens
+
+# Builds the prompt context from vector query matches
+# Matches below the score cutoff are dropped, the rest are picked by max-marginal-relevance,
+# text repeated between overlapping chunks is removed and chunks are packed up to a token budget
+context_token_budget = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1500'))
+context_score_cutoff = float(os.getenv('CONTEXT_SCORE_CUTOFF', '0.2'))
+context_mmr_lambda = float(os.getenv('CONTEXT_MMR_LAMBDA', '0.7'))
+
+# The chunker uses chunk_overlap=160, shorter shared runs are treated as coincidence
+min_overlap = 20
+max_overlap = 400
+
+
+def normalize(vectors):
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+
+    return vectors / norms
+
+
+# Returns the match positions in max-marginal-relevance order
+# lambda_mult=1 ranks purely by relevance, lower values favour chunks unlike those already chosen
+def mmr_order(query_embedding, vectors, lambda_mult=context_mmr_lambda):
+
+    vectors = normalize(vectors)
+    relevance = vectors @ normalize(query_embedding)
+    similarity = vectors @ vectors.T
+
+    order = []
+    remaining = list(range(len(vectors)))
+
+    while remaining:
+
+        if order:
+            redundancy = similarity[np.ix_(remaining, order)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        order.append(remaining.pop(int(np.argmax(scores))))
+
+    return order
+
+
+# Removes text this chunk shares with chunks already in the context
+# Neighbouring chunks overlap at the boundary, so the shared prefix or suffix is trimmed
+def strip_overlap(text, selected):
+
+    for other in selected:
+
+        if text in other:
+            return ""
+
+        for size in range(min(len(text), len(other), max_overlap), min_overlap - 1, -1):
+            if other.endswith(text[:size]):
+                text = text[size:]
+                break
+
+        for size in range(min(len(text), len(other), max_overlap), min_overlap - 1, -1):
+            if other.startswith(text[-size:]):
+                text = text[:-size]
+                break
+
+    return text.strip()
+
+
+def format_context(chunks):
+
+    return "".join(
+        "________________________________\n"
+        "EXCERPT\n"
+        "-------\n"
+        f"{chunk}\n"
+        for chunk in chunks
+    )
+
+
+# matches: Vector query matches with score, metadata['chunk'] and (for max-marginal-relevance) values
+def build_context(matches, query_embedding=None, max_chunks=5, token_budget=context_token_budget,
+                  score_cutoff=context_score_cutoff, lambda_mult=context_mmr_lambda):
+
+    matches = [match for match in matches if match['score'] >= score_cutoff]
+
+    if query_embedding is not None and len(matches) > 1 and all(match.get('values') for match in matches):
+        matches = [matches[i] for i in mmr_order(query_embedding, [match['values'] for match in matches], lambda_mult)]
+
+    selected = []
+    chunks = []
+    tokens = 0
+
+    for match in matches:
+
+        if len(chunks) >= max_chunks:
+            break
+
+        chunk = match['metadata']['chunk']
+        text = strip_overlap(chunk, selected)
+
+        if not text:
+            continue
+
+        chunk_tokens = estimate_tokens(text)
+        if tokens + chunk_tokens > token_budget:
+            continue
+
+        # Only chunks that reach the prompt can cover the overlap of later chunks
+        chunks.append(text)
+        selected.append(chunk)
+        tokens += chunk_tokens
+
+    return format_context(chunks)
@@ -1,25 +1,65 @@
-import os.path
-from dotenv import load_dotenv
-from pinecone import Pinecone
-from openai import OpenAI
+import os
+import time
+from _clients import get_openai
+from _embedding_cache import cache_key, get_embedding_cache
 
-load_dotenv()
+# Embedding profile, text-embedding-3 models return shortened vectors for EMBEDDING_DIMENSIONS below 1536
+embedding_model = "text-embedding-3-small"
+embedding_dimensions = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
 
-oa = OpenAI()
-pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-index_name = 'tennis-glossary'
+# Set EMBEDDING_CACHE=off to always call the embeddings API
+use_embedding_cache = os.getenv('EMBEDDING_CACHE', 'on').lower() != 'off'
 
 # We'll use this function to embed the chunk
 # We'll also use it to embed the question for query
+# Embeddings are served from the local cache when the same text has been embedded before
 def embed_chunks(text):
 
-    response = oa.embeddings.create(
-        input=text,
-        model="text-embedding-3-small"
-    )
+    return embed_chunks_batch([text])[0]
 
-    # print(response)
+# We'll use this function to embed many chunks in a single API call
+# Only the texts missing from the cache are sent, in the same order as the input texts
+# Pass dimensions to override the configured embedding profile
+def embed_chunks_batch(texts, dimensions=None):
 
-    embedding = response.data[0].embedding
+    dimensions = dimensions or embedding_dimensions
+    texts = list(texts)
+    keys = [cache_key(text, embedding_model, dimensions) for text in texts]
+    cached = get_embedding_cache().get_many(keys, texts) if use_embedding_cache else {}
 
-    return embedding
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached:
+            missing.setdefault(key, text)
+
+    if missing:
+
+        start = time.perf_counter()
+        response = get_openai().embeddings.create(
+            input=list(missing.values()),
+            model=embedding_model,
+            dimensions=dimensions
+        )
+        elapsed = time.perf_counter() - start
+
+        # print(response)
+
+        embeddings = [data.embedding for data in sorted(response.data, key=lambda data: data.index)]
+        fetched = dict(zip(missing.keys(), embeddings))
+
+        if use_embedding_cache:
+            get_embedding_cache().put_many(fetched, elapsed)
+
+        cached.update(fetched)
+
+    return [cached[key] for key in keys]
+
+# Hit/miss counters for the embedding cache
+def embedding_cache_stats():
+
+    return get_embedding_cache().stats()
+
+# Rough token estimate (~4 characters per token for English text)
+def estimate_tokens(text):
+
+    return len(text) // 4 + 1
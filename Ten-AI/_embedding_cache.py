@@ -0,0 +1,159 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+# On-disk embedding cache, keyed by (model, dimensions, hash of normalized text)
+# Vectors are stored as float32 blobs in SQLite and evicted least recently used first
+cache_path = os.getenv('EMBEDDING_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'data', 'embedding_cache.sqlite'))
+cache_max_entries = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '50000'))
+
+
+# Collapse whitespace so trivially different copies of a text share one entry
+def normalize_text(text):
+
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text, model, dimensions):
+
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+    return f"{model}:{dimensions}:{digest}"
+
+
+class EmbeddingCache:
+
+    def __init__(self, path=cache_path, max_entries=cache_max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.api_seconds = 0.0
+        self.api_texts = 0
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.connection.commit()
+
+    # Returns a dict of {key: vector} for the keys found in the cache
+    def get_many(self, keys, texts=None):
+
+        keys = list(keys)
+        found = {}
+
+        with self.lock:
+
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self.connection.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            if texts is not None:
+                self.tokens_saved += sum(len(text) // 4 + 1 for key, text in zip(keys, texts) if key in found)
+
+        return found
+
+    def get(self, key, text=None):
+
+        return self.get_many([key], None if text is None else [text]).get(key)
+
+    # Stores {key: vector} pairs, api_seconds is the time spent fetching them
+    def put_many(self, items, api_seconds=0.0):
+
+        now = time.time()
+
+        with self.lock:
+
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array('f', vector).tobytes(), now) for key, vector in items.items()]
+            )
+            self.api_seconds += api_seconds
+            self.api_texts += len(items)
+            self._evict()
+            self.connection.commit()
+
+    def put(self, key, vector, api_seconds=0.0):
+
+        self.put_many({key: vector}, api_seconds)
+
+    def _evict(self):
+
+        count = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def clear(self):
+
+        with self.lock:
+            self.connection.execute("DELETE FROM embeddings")
+            self.connection.commit()
+
+    # Hit/miss counters plus an estimate of the embedding latency and tokens saved
+    def stats(self):
+
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            seconds_per_text = self.api_seconds / self.api_texts if self.api_texts else 0.0
+
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+                "seconds_saved": self.hits * seconds_per_text,
+            }
+
+
+embedding_cache = None
+embedding_cache_lock = threading.Lock()
+
+
+# The cache is created on first use so importing this module stays cheap
+def get_embedding_cache():
+
+    global embedding_cache
+
+    if embedding_cache is None:
+        with embedding_cache_lock:
+            if embedding_cache is None:
+                embedding_cache = EmbeddingCache()
+
+    return embedding_cache
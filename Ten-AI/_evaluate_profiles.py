@@ -0,0 +1,89 @@
+import time
+import argparse
+import numpy as np
+from _embed_chunks import embed_chunks_batch
+from _glossary import get_glossary
+from _index_manifest import chunk_id
+from _vector_store import LocalVectorStore
+
+# Recall@k evaluation of embedding profiles on the glossary question set
+# Every glossary term gets the question "What is <term>?", and the relevant record is that term's "Term: definition" chunk
+# Each profile is compared on recall@k, agreement with the full float32 profile, index memory and query time
+#   python _evaluate_profiles.py [--k 5] [--profiles 1536:float32 512:float32 512:int8 256:int8]
+
+default_profiles = ["1536:float32", "1024:float32", "512:float32", "512:int8", "256:float32", "256:int8"]
+
+
+def glossary_question_set():
+
+    records = [f"{term}: {definition}" for term, definition in get_glossary().entries]
+    questions = [f"What is {term}?" for term, _ in get_glossary().entries]
+
+    return records, questions
+
+
+def build_store(records, dimensions, quantization):
+
+    store = LocalVectorStore(quantization=quantization)
+    vectors = embed_chunks_batch(records, dimensions=dimensions)
+    store.upsert([{"id": chunk_id(record), "values": vector, "metadata": {}} for record, vector in zip(records, vectors)])
+
+    return store
+
+
+def evaluate_profile(records, questions, dimensions, quantization, k, baseline=None):
+
+    store = build_store(records, dimensions, quantization)
+    question_vectors = embed_chunks_batch(questions, dimensions=dimensions)
+
+    hits = 0
+    agreement = []
+    results = []
+    start = time.perf_counter()
+
+    for vector in question_vectors:
+        ids = [match["id"] for match in store.query(vector, top_k=k, include_metadata=False)["matches"]]
+        results.append(ids)
+
+    query_seconds = (time.perf_counter() - start) / len(questions)
+
+    for record, ids in zip(records, results):
+        hits += chunk_id(record) in ids
+
+    if baseline is not None:
+        agreement = [len(set(ids) & set(base)) / k for ids, base in zip(results, baseline)]
+
+    return results, {
+        "profile": f"{dimensions}:{quantization}",
+        "recall": hits / len(questions),
+        "agreement": float(np.mean(agreement)) if baseline is not None else 1.0,
+        "index_bytes": store.nbytes,
+        "query_ms": query_seconds * 1000,
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compare embedding profiles by recall@k on the glossary question set.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--profiles", nargs="+", default=default_profiles, help="dimensions:quantization pairs, the first one is the baseline")
+    args = parser.parse_args()
+
+    records, questions = glossary_question_set()
+    print(f"Evaluating {len(args.profiles)} profiles on {len(questions)} glossary questions (k={args.k})\n")
+
+    baseline = None
+    reports = []
+    for profile in args.profiles:
+        dimensions, _, quantization = profile.partition(":")
+        results, report = evaluate_profile(records, questions, int(dimensions), quantization or "float32", args.k, baseline)
+        baseline = results if baseline is None else baseline
+        reports.append(report)
+
+    print(f"{'profile':<16}{'recall@k':>10}{'agreement':>11}{'index KB':>10}{'memory':>8}{'query ms':>10}")
+    for report in reports:
+        print(f"{report['profile']:<16}{report['recall']:>10.3f}{report['agreement']:>11.3f}"
+              f"{report['index_bytes'] / 1024:>10.1f}{reports[0]['index_bytes'] / report['index_bytes']:>7.1f}x{report['query_ms']:>10.3f}")
+
+if __name__ == "__main__":
+    main()
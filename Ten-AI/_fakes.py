@@ -0,0 +1,117 @@
+import time
+import hashlib
+import itertools
+from types import SimpleNamespace
+import numpy as np
+from _embed_chunks import estimate_tokens
+from _vector_store import LocalVectorStore
+
+# Local stand-ins for the OpenAI and Pinecone clients, used by the offline benchmarks
+# Outputs are deterministic (derived from a hash of the input) and every call sleeps for a configurable latency
+
+
+def fake_embedding(text, dimensions):
+
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeEmbeddings:
+
+    def __init__(self, latency, dimensions):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def create(self, input, model, dimensions=None, **kwargs):
+        time.sleep(self.latency)
+        self.calls += 1
+        texts = [input] if isinstance(input, str) else list(input)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_embedding(text, dimensions or self.dimensions))
+            for i, text in enumerate(texts)
+        ])
+
+
+class FakeCompletions:
+
+    def __init__(self, latency, tokens_per_second, answer_tokens):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+
+    def answer(self, messages):
+        question = messages[-1]["content"]
+        digest = hashlib.sha256(question.encode("utf-8")).hexdigest()
+        words = [digest[i:i + 6] for i in range(0, len(digest), 6)]
+        return [f"{word} " for word in itertools.islice(itertools.cycle(words), self.answer_tokens)]
+
+    def usage(self, messages, tokens):
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(tokens), total_tokens=prompt_tokens + len(tokens))
+
+    def create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        tokens = self.answer(messages)
+        time.sleep(self.latency)
+
+        if stream:
+            return self.stream(messages, tokens)
+
+        time.sleep(len(tokens) / self.tokens_per_second)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="".join(tokens)))],
+            usage=self.usage(messages, tokens),
+        )
+
+    def stream(self, messages, tokens):
+        for token in tokens:
+            time.sleep(1 / self.tokens_per_second)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], usage=None)
+        yield SimpleNamespace(choices=[], usage=self.usage(messages, tokens))
+
+
+class FakeOpenAI:
+    """
+    Stand-in for the OpenAI client (embeddings and chat completions).
+
+    embed_latency: Seconds per embeddings request.
+    chat_latency: Seconds before the first completion token.
+    tokens_per_second: Completion generation speed.
+    """
+
+    def __init__(self, embed_latency=0.05, chat_latency=0.3, tokens_per_second=200, answer_tokens=60, dimensions=1536):
+        self.embeddings = FakeEmbeddings(embed_latency, dimensions)
+        self.chat = SimpleNamespace(completions=FakeCompletions(chat_latency, tokens_per_second, answer_tokens))
+
+
+class FakePineconeIndex(LocalVectorStore):
+    """
+    Stand-in for a Pinecone index, a LocalVectorStore that sleeps for a network round trip on every call.
+    Also used to tune ingestion batch sizes without network calls, calls counts the requests per method.
+
+    latency: Seconds per query, upsert or delete request.
+    """
+
+    def __init__(self, latency=0.03):
+        super().__init__(quantization='float32')
+        self.latency = latency
+        self.calls = {"upsert": 0, "delete": 0, "query": 0}
+
+    def upsert(self, vectors):
+        time.sleep(self.latency)
+        self.calls["upsert"] += 1
+        return super().upsert(vectors)
+
+    def delete(self, ids):
+        time.sleep(self.latency)
+        self.calls["delete"] += 1
+        return super().delete(ids)
+
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False):
+        time.sleep(self.latency)
+        self.calls["query"] += 1
+        return super().query(vector, top_k, include_metadata, include_values)
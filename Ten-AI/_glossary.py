@@ -0,0 +1,148 @@
+import os
+import re
+import csv
+import difflib
+import threading
+
+# In-memory term dictionary and inverted keyword index for the tennis glossary
+# Questions that name a known term are answered from an exact or fuzzy lookup, without an embedding call
+glossary_path = os.path.join(os.path.dirname(__file__), 'data', 'glossary-tennis.csv')
+glossary_fuzzy_cutoff = float(os.getenv('GLOSSARY_FUZZY_CUTOFF', '0.85'))
+
+# Terms longer than this are wrapped lines of a definition rather than glossary terms
+max_term_length = 80
+
+# Phrasings of "what is <term>", the captured group is the candidate term
+question_patterns = [
+    r"^(?:what|who)(?:'s| is| are| was| were) (?:an? |the )?(?P<term>.+?)$",
+    r"^what does (?:an? |the )?(?P<term>.+?) mean$",
+    r"^(?:what is |what's )?the (?:meaning|definition) of (?:an? |the )?(?P<term>.+?)$",
+    r"^(?:define|explain|meaning of|definition of) (?:an? |the )?(?P<term>.+?)$",
+    r"^(?P<term>.+?) meaning$",
+]
+question_suffixes = r"(?: in tennis| in a tennis match| in a match| in doubles| in singles)$"
+
+
+def normalize_term(text):
+
+    text = re.sub(r"\[\d+\]", "", text.lower())
+    text = re.sub(r"[^\w\s'&/-]", " ", text)
+
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def keywords(text):
+
+    return {word for word in normalize_term(text).split() if len(word) > 2}
+
+
+# Splits "Ball boy (also ball girl or ballkid)" into its names: ball boy, ball girl, ballkid
+def term_names(head):
+
+    names = []
+    aliases = re.findall(r"\(([^)]*)\)?", head)
+    main = re.sub(r"\(.*", "", head)
+
+    for part in [main] + aliases:
+        for name in re.split(r";|,| or ", part):
+            name = re.sub(r"^\s*(?:also|or|formerly|abbreviated|short for)\s+", "", name)
+            name = normalize_term(name)
+            if name and name not in names:
+                names.append(name)
+
+    return names
+
+
+# Returns (term, definition) pairs from "Term: definition" lines
+# The glossary is a single column CSV, so lines containing quotes are CSV quoted
+def parse_glossary(text):
+
+    entries = []
+
+    for row in csv.reader(text.splitlines()):
+
+        line = row[0] if row else ""
+
+        head, separator, definition = line.partition(": ")
+        head = head.strip()
+
+        if not separator or not head or len(head) > max_term_length:
+            continue
+
+        entries.append((head, re.sub(r"\[\d+\]", "", definition).strip()))
+
+    return entries
+
+
+class Glossary:
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.terms = {}
+        self.keyword_index = {}
+
+        for position, (head, definition) in enumerate(entries):
+            for name in term_names(head):
+                self.terms.setdefault(name, position)
+                for word in keywords(name):
+                    self.keyword_index.setdefault(word, set()).add(name)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def from_file(cls, path=glossary_path):
+
+        with open(path, encoding='utf-8') as file:
+            return cls(parse_glossary(file.read()))
+
+    # Returns the candidate term named by a definitional question, or None
+    def extract_term(self, question):
+
+        text = normalize_term(question)
+        text = re.sub(question_suffixes, "", text)
+
+        if text in self.terms:
+            return text
+
+        for pattern in question_patterns:
+            match = re.match(pattern, text)
+            if match:
+                return re.sub(question_suffixes, "", match.group("term")).strip()
+
+        return None
+
+    # Exact lookup first, then a fuzzy match against the terms sharing a keyword with the candidate
+    def lookup(self, question, cutoff=glossary_fuzzy_cutoff):
+
+        term = self.extract_term(question)
+
+        if not term:
+            return None
+
+        if term in self.terms:
+            return self.entries[self.terms[term]]
+
+        candidates = set()
+        for word in keywords(term):
+            candidates |= self.keyword_index.get(word, set())
+
+        matches = difflib.get_close_matches(term, candidates or self.terms.keys(), n=1, cutoff=cutoff)
+
+        return self.entries[self.terms[matches[0]]] if matches else None
+
+
+glossary = None
+glossary_lock = threading.Lock()
+
+
+def get_glossary():
+
+    global glossary
+
+    if glossary is None:
+        with glossary_lock:
+            if glossary is None:
+                glossary = Glossary.from_file()
+
+    return glossary
@@ -0,0 +1,53 @@
+import os
+import json
+import hashlib
+
+# Local record of the chunk IDs last upserted into an index, used for incremental syncs
+# The manifest version changes whenever the set of indexed chunks changes
+manifest_dir = os.getenv('INDEX_MANIFEST_DIR', os.path.join(os.path.dirname(__file__), 'data', 'manifests'))
+
+
+def manifest_path(index_name, backend):
+
+    return os.path.join(manifest_dir, f"{backend}-{index_name}.json")
+
+
+# Stable chunk ID derived from the source file and the chunk content
+# The manifest records one source per ID, so identical text in two files gets two IDs and each file owns its own vector
+def chunk_id(chunk, source=None):
+
+    key = chunk if source is None else f"{source}\0{chunk}"
+
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def manifest_version(chunks):
+
+    return hashlib.sha256("\n".join(sorted(chunks)).encode("utf-8")).hexdigest()[:16]
+
+
+def load_manifest(path):
+
+    if not os.path.exists(path):
+        return {"model": None, "dimensions": None, "version": None, "chunks": {}}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+# Written to a temporary file first so an interrupted sync never leaves a truncated manifest
+def save_manifest(path, manifest):
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    manifest["version"] = manifest_version(manifest["chunks"])
+
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+
+    os.replace(path + '.tmp', path)
+
+
+# Version of what is currently indexed, or None when nothing has been synced yet
+def index_version(path):
+
+    return load_manifest(path)["version"]
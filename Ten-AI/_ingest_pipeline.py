@@ -0,0 +1,304 @@
+import os
+import re
+import glob
+import time
+import queue
+import argparse
+import threading
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from _clients import get_pinecone_index, index_name, retrieval_backend
+from _embed_chunks import embed_chunks_batch, embedding_model, embedding_dimensions
+from _glossary import parse_glossary
+from _index_manifest import chunk_id, load_manifest, save_manifest, manifest_path
+from _vector_store import snapshot_path
+from _load_chunks import (batch_by_token_budget, call_with_retries, check_tracked_index, default_chunking, ensure_index, open_local_store,
+                          embed_token_budget, upsert_batch_size, max_retries)
+
+# Streaming ingestion pipeline for large corpora: read -> split -> embed -> upsert
+# Each stage is a generator running in its own thread, connected to the next stage by a bounded queue,
+# so embedding and upserting overlap and memory use does not grow with the size of the files
+#   python _ingest_pipeline.py --source 'data/rulebooks/**/*.txt' [--backend pinecone|local] [--chunking text|glossary]
+
+read_block_size = 64 * 1024
+split_window = 32 * 1024
+queue_size = 8
+source_extensions = ('.txt', '.csv', '.md')
+
+
+# Accepts a file, a directory (searched recursively) or a glob pattern, paths are relative to this directory
+def expand_sources(source):
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(base, source)
+
+    if os.path.isdir(path):
+        paths = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names if name.endswith(source_extensions)]
+    elif glob.has_magic(source):
+        paths = glob.glob(path, recursive=True)
+    else:
+        paths = [path]
+
+    return sorted(os.path.relpath(path, base) for path in paths if os.path.isfile(path))
+
+
+# Translates a glob pattern to a regular expression with the same matching rules as glob.glob(recursive=True)
+def glob_regex(pattern):
+
+    parts = re.split(r"(\*\*/|\*\*|\*|\?|\[[^\]]*\])", pattern)
+    tokens = {"**/": "(?:.*/)?", "**": ".*", "*": "[^/]*", "?": "[^/]"}
+
+    return re.compile("".join(tokens.get(part) or (part if part.startswith("[") else re.escape(part)) for part in parts) + r"\Z")
+
+
+# Whether a manifest source path belongs to the file, directory or glob pattern being ingested
+# Sources in scope but no longer on disk were deleted, so their chunks are removed from the index
+def in_source_scope(source, path):
+
+    base = os.path.dirname(os.path.abspath(__file__))
+    source = os.path.normpath(source)
+
+    if os.path.isdir(os.path.join(base, source)):
+        return path.startswith(source + os.sep) and path.endswith(source_extensions)
+    if glob.has_magic(source):
+        return bool(glob_regex(source).match(path))
+
+    return path == source
+
+
+class StageStats:
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def report(self, elapsed):
+        rate = self.items / elapsed if elapsed else 0.0
+        megabytes = f", {self.bytes / 1e6:.2f} MB" if self.bytes else ""
+        return (f"{self.name:<7} {self.items:>8} {self.unit:<7} {rate:>9.1f} {self.unit}/sec "
+                f"(busy {self.seconds:.2f}s{megabytes})")
+
+
+# Runs a generator in a background thread and yields its items through a bounded queue
+# The producer blocks when the queue is full, which bounds the memory held between stages
+def threaded(generator, maxsize=queue_size):
+
+    items = queue.Queue(maxsize)
+    done = object()
+    failure = []
+
+    def produce():
+        try:
+            for item in generator:
+                items.put(item)
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            items.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    while True:
+        item = items.get()
+        if item is done:
+            break
+        yield item
+
+    if failure:
+        raise failure[0]
+
+
+# Stage 1: read the files in fixed size blocks, None marks the end of a file
+def read_stage(paths, stats):
+
+    base = os.path.dirname(os.path.abspath(__file__))
+
+    for path in paths:
+        with open(os.path.join(base, path), encoding='utf-8') as file:
+            while True:
+                start = time.perf_counter()
+                block = file.read(read_block_size)
+                stats.seconds += time.perf_counter() - start
+                if not block:
+                    break
+                stats.items += 1
+                stats.bytes += len(block.encode('utf-8'))
+                yield path, block
+        yield path, None
+
+
+# Stage 2: split each file into chunks while it streams in
+# Text chunking splits a window of the file at a time and carries the last chunk over to the next window,
+# glossary chunking parses complete "Term: definition" lines
+def split_stage(blocks, chunking, stats):
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1600, chunk_overlap=160)
+    buffers = {}
+
+    for path, block in blocks:
+
+        start = time.perf_counter()
+        mode = chunking or default_chunking(path)
+        buffer = buffers.pop(path, "") + (block or "")
+        chunks = []
+
+        if mode == 'glossary':
+            complete, _, partial = buffer.rpartition("\n") if block is not None else (buffer, "", "")
+            chunks = [f"{term}: {definition}" for term, definition in parse_glossary(complete)]
+            buffer = partial
+        elif block is None:
+            chunks = text_splitter.split_text(buffer) if buffer.strip() else []
+            buffer = ""
+        elif len(buffer) >= split_window:
+            chunks = text_splitter.split_text(buffer)
+            buffer = chunks.pop() if chunks else ""
+
+        if block is not None:
+            buffers[path] = buffer
+
+        stats.seconds += time.perf_counter() - start
+
+        for chunk in chunks:
+            stats.items += 1
+            yield path, chunk
+
+
+# Stage 3: skip chunks the manifest says are already indexed, embed the rest in token budgeted batches
+# Every chunk ID seen is recorded in seen[path] so removed chunks can be deleted afterwards
+def embed_stage(chunks, indexed, seen, token_budget, retries, stats):
+
+    def new_chunks():
+        for path, chunk in chunks:
+            id = chunk_id(chunk, path)
+            if id in seen.setdefault(path, set()):
+                continue
+            seen[path].add(id)
+            if id not in indexed.get(path, ()):
+                yield path, id, chunk
+
+    for batch in batch_by_token_budget(new_chunks(), token_budget=token_budget, key=lambda item: item[2]):
+
+        start = time.perf_counter()
+        embeddings = call_with_retries(embed_chunks_batch, [chunk for _, _, chunk in batch], retries=retries)
+        stats.seconds += time.perf_counter() - start
+        stats.items += len(batch)
+
+        yield [{
+            "id": id,
+            "values": embedding,
+            "metadata": {
+                "chunk": chunk,
+                "source": path,
+            }
+        } for (path, id, chunk), embedding in zip(batch, embeddings)]
+
+
+# Stage 4 runs on the calling thread: upserts vectors in batches of batch_size as they are embedded
+# Set full to ignore the manifest, e.g. when the index was recreated empty
+def ingest(source, index=None, manifest_file=None, chunking=None, full=False, batch_size=upsert_batch_size,
+           token_budget=embed_token_budget, retries=max_retries):
+
+    if index is None:
+        index = get_pinecone_index(index_name)
+    if manifest_file is None:
+        manifest_file = manifest_path(index_name, retrieval_backend)
+
+    paths = expand_sources(source)
+    if not paths:
+        raise FileNotFoundError(f"No source files found for '{source}'.")
+
+    manifest = load_manifest(manifest_file)
+    if not full:
+        check_tracked_index(index, manifest)
+    if full or (manifest["model"], manifest["dimensions"]) != (embedding_model, embedding_dimensions):
+        manifest = {"model": embedding_model, "dimensions": embedding_dimensions, "version": None, "chunks": {}}
+
+    indexed = {}
+    for id, entry in manifest["chunks"].items():
+        indexed.setdefault(entry["source"], set()).add(id)
+
+    read_stats = StageStats("read", "blocks")
+    split_stats = StageStats("split", "chunks")
+    embed_stats = StageStats("embed", "chunks")
+    upsert_stats = StageStats("upsert", "vectors")
+    seen = {}
+
+    print(f"Ingesting {len(paths)} files from '{source}'...")
+    start = time.perf_counter()
+
+    blocks = threaded(read_stage(paths, read_stats))
+    chunks = threaded(split_stage(blocks, chunking, split_stats))
+    vectors = threaded(embed_stage(chunks, indexed, seen, token_budget, retries, embed_stats))
+
+    def upsert(batch):
+        upsert_start = time.perf_counter()
+        call_with_retries(index.upsert, vectors=batch, retries=retries)
+        upsert_stats.seconds += time.perf_counter() - upsert_start
+        upsert_stats.items += len(batch)
+        for vector in batch:
+            manifest["chunks"][vector["id"]] = {"source": vector["metadata"]["source"]}
+
+    pending = []
+    for batch in vectors:
+        pending.extend(batch)
+        while len(pending) >= batch_size:
+            upsert(pending[:batch_size])
+            pending = pending[batch_size:]
+
+    if pending:
+        upsert(pending)
+
+    # Chunks that no longer exist in the ingested files are deleted, as are all chunks of deleted files of the source
+    deleted_paths = [path for path in indexed if path not in seen and path not in paths and in_source_scope(source, path)]
+    removed = sorted(id for path in paths for id in indexed.get(path, set()) - seen.get(path, set()))
+    removed += sorted(id for path in deleted_paths for id in indexed[path])
+    for i in range(0, len(removed), batch_size):
+        call_with_retries(index.delete, ids=removed[i:i + batch_size], retries=retries)
+    for id in removed:
+        del manifest["chunks"][id]
+
+    save_manifest(manifest_file, manifest)
+
+    elapsed = time.perf_counter() - start
+    unchanged = sum(len(ids) for ids in seen.values()) - embed_stats.items
+
+    print(f"Ingested {len(paths)} files in {elapsed:.2f}s: {embed_stats.items} new or changed, "
+          f"{len(removed)} removed ({len(deleted_paths)} deleted files), {unchanged} unchanged chunks.")
+    for stats in (read_stats, split_stats, embed_stats, upsert_stats):
+        print("  " + stats.report(elapsed))
+
+    return {
+        "files": len(paths),
+        "seconds": elapsed,
+        "added": embed_stats.items,
+        "removed": len(removed),
+        "deleted_files": len(deleted_paths),
+        "unchanged": unchanged,
+        "stages": {stats.name: {"items": stats.items, "bytes": stats.bytes, "busy_seconds": stats.seconds,
+                                "items_per_second": stats.items / elapsed if elapsed else 0.0}
+                   for stats in (read_stats, split_stats, embed_stats, upsert_stats)},
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Stream a file, directory or glob of files into the Ten-AI index.")
+    parser.add_argument("--source", required=True, help="file, directory or glob pattern, relative to the Ten-AI directory")
+    parser.add_argument("--backend", choices=["pinecone", "local"], default=retrieval_backend)
+    parser.add_argument("--chunking", choices=["text", "glossary"], default=None, help="defaults to glossary for glossary files, text otherwise")
+    parser.add_argument("--batch-size", type=int, default=upsert_batch_size)
+    args = parser.parse_args()
+
+    if args.backend == 'local':
+        manifest_file = manifest_path(index_name, 'local')
+        store, full = open_local_store(snapshot_path, manifest_file)
+        ingest(args.source, index=store, manifest_file=manifest_file, chunking=args.chunking, full=full, batch_size=args.batch_size)
+        store.save(snapshot_path)
+    else:
+        ensure_index(index_name)
+        ingest(args.source, manifest_file=manifest_path(index_name, 'pinecone'), chunking=args.chunking, batch_size=args.batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,33 @@
 import os.path
-from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
+import time
+import argparse
 
 # you need to do a pip install of LangChain, you can just use the text splitter
 # pip install langchain
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from _embed_chunks import embed_chunks
+from _clients import get_pinecone, get_pinecone_index, index_name, retrieval_backend
+from _embed_chunks import embed_chunks_batch, embedding_cache_stats, estimate_tokens
+from _embed_chunks import embedding_model, embedding_dimensions
+from _vector_store import LocalVectorStore, snapshot_path
+from _index_manifest import chunk_id, load_manifest, save_manifest, manifest_path
+from _glossary import parse_glossary
 
-load_dotenv()
+# Batching limits for ingestion
+# The embeddings API accepts up to 2048 inputs per request, the token budget keeps requests well below its limit
+embed_token_budget = 100000
+embed_max_inputs = 2048
+upsert_batch_size = 100
+max_retries = 3
 
-oa = OpenAI()
-pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-index_name = 'tennis-glossary'
+# Set INDEX_SYNC_MODE=full to drop and rebuild the index instead of syncing only the changed chunks
+index_sync_mode = os.getenv('INDEX_SYNC_MODE', 'incremental').lower()
 
-# We'll use this function to embed the chunk
-# We'll also use it to embed the question for query
-def embed_chunks(text):
-
-    response = oa.embeddings.create(
-        input=text,
-        model="text-embedding-3-small"
-    )
-
-    print(response)
-
-    embedding = response.data[0].embedding
+# This will drop and recreate your Pinecone index
+def create_index(index):
 
-    return embedding
+    from pinecone import ServerlessSpec
 
-
-# This will create your Pinecone index
-def create_index(index):
+    pc = get_pinecone()
 
     try:
 
@@ -43,7 +39,7 @@ def create_index(index):
 
     pc.create_index(
         name=index,
-        dimension=1536,
+        dimension=embedding_dimensions,
         metric='cosine',
         spec=ServerlessSpec(
             region='us-east-1',
@@ -51,32 +47,289 @@ def create_index(index):
         )
     )
 
-# This function will split the text into chunk and upsert them
-# TODO amend the code so you are using the a suitable chunk_size and chunk_overlap
-def upsert_chunks_from(text_file):
+# This will create your Pinecone index only if it does not exist, the live index is left untouched
+def ensure_index(index):
+
+    from pinecone import ServerlessSpec
+
+    pc = get_pinecone()
+
+    if index in pc.list_indexes().names():
+
+        dimension = pc.describe_index(index).dimension
+        if dimension != embedding_dimensions:
+            raise ValueError(f"Index '{index}' has dimension {dimension} but EMBEDDING_DIMENSIONS is {embedding_dimensions}, "
+                             "rebuild it with --mode full.")
+
+    else:
+
+        print("Index does not exist, creating new index...")
+
+        pc.create_index(
+            name=index,
+            dimension=embedding_dimensions,
+            metric='cosine',
+            spec=ServerlessSpec(
+                region='us-east-1',
+                cloud='aws'
+            )
+        )
+
+# This function groups chunks so each embeddings request stays inside the token budget
+# Use key to get the text of each item when the chunks are not plain strings
+def batch_by_token_budget(chunks, token_budget=embed_token_budget, max_inputs=embed_max_inputs, key=None):
+
+    batch = []
+    batch_tokens = 0
+
+    for chunk in chunks:
+
+        tokens = estimate_tokens(chunk if key is None else key(chunk))
 
-    index = pc.Index(index_name)
+        if batch and (batch_tokens + tokens > token_budget or len(batch) >= max_inputs):
+            yield batch
+            batch = []
+            batch_tokens = 0
 
-    with open(os.path.dirname(__file__) + "/" + text_file) as file:
+        batch.append(chunk)
+        batch_tokens += tokens
+
+    if batch:
+        yield batch
+
+# Errors of the OpenAI, Pinecone and HTTP client libraries that are worth retrying, matched by class name
+# so the clients stay optional imports
+transient_error_names = {
+    "RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+    "ServiceException", "MaxRetryError", "ProtocolError", "TransportError",
+}
+
+# Rate limits, connection and timeout errors and 5xx responses are transient,
+# anything else (e.g. a 400 for an input that is too long or a wrong dimension) fails the same way on every attempt
+def is_transient_error(error):
+
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    return any(cls.__name__ in transient_error_names for cls in type(error).__mro__)
+
+# This function retries a batch call that failed with a transient error, with exponential backoff
+def call_with_retries(function, *args, retries=max_retries, backoff=1.0, **kwargs):
+
+    for attempt in range(retries + 1):
+
+        try:
+
+            return function(*args, **kwargs)
+
+        except Exception as e:
+
+            if attempt == retries or not is_transient_error(e):
+                raise
+
+            delay = backoff * (2 ** attempt)
+            print(f"Batch failed ({e}), retrying in {delay:.1f}s ({attempt + 1}/{retries})...")
+            time.sleep(delay)
+
+# Chunking used when none is given, glossary files get one record per term
+def default_chunking(text_file):
+
+    return 'glossary' if os.path.basename(text_file).startswith('glossary') else 'text'
+
+# This function will split the text into chunks
+# 'text' chunking splits into overlapping character windows, 'glossary' chunking makes one "Term: definition" record per term
+# TODO amend the code so you are using the a suitable chunk_size and chunk_overlap
+def split_chunks_from(text_file, chunking='text'):
+
+    with open(os.path.dirname(__file__) + "/" + text_file, encoding='utf-8') as file:
         text = file.read()
 
+    if chunking == 'glossary':
+        return [f"{term}: {definition}" for term, definition in parse_glossary(text)]
+
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1600, chunk_overlap=160)
-    chunks = text_splitter.split_text(text)
 
-    for i, chunk in enumerate(chunks):
+    return text_splitter.split_text(text)
+
+# This function embeds {id: chunk} pairs and upserts them
+# Chunks are embedded in token budgeted batches and upserted in batches of batch_size
+def embed_and_upsert(chunks_by_id, index, source=None, batch_size=upsert_batch_size, token_budget=embed_token_budget, retries=max_retries):
+
+    start = time.perf_counter()
+    embed_time = 0.0
+    upsert_time = 0.0
+    vectors = []
 
-        dict = {
-            "id": str(i),
-            "values": embed_chunks(chunk),
-            "metadata": {
-                "chunk": chunk,
-            }
-        }
+    for batch in batch_by_token_budget(chunks_by_id.items(), token_budget=token_budget, key=lambda item: item[1]):
 
-        print(dict)
+        batch_start = time.perf_counter()
+        embeddings = call_with_retries(embed_chunks_batch, [chunk for _, chunk in batch], retries=retries)
+        embed_time += time.perf_counter() - batch_start
 
-        index.upsert(vectors=[dict])
+        for (id, chunk), embedding in zip(batch, embeddings):
+
+            vectors.append({
+                "id": id,
+                "values": embedding,
+                "metadata": {
+                    "chunk": chunk,
+                    "source": source,
+                }
+            })
+
+    for i in range(0, len(vectors), batch_size):
+
+        batch_start = time.perf_counter()
+        call_with_retries(index.upsert, vectors=vectors[i:i + batch_size], retries=retries)
+        upsert_time += time.perf_counter() - batch_start
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "chunks": len(vectors),
+        "seconds": elapsed,
+        "embed_seconds": embed_time,
+        "upsert_seconds": upsert_time,
+        "chunks_per_second": len(vectors) / elapsed if elapsed else 0.0,
+    }
+
+    print(f"Upserted {stats['chunks']} chunks in {elapsed:.2f}s "
+          f"({stats['chunks_per_second']:.1f} chunks/sec, embed {embed_time:.2f}s, upsert {upsert_time:.2f}s)")
+    print(f"Embedding cache: {embedding_cache_stats()}")
+
+    return stats
+
+# Number of vectors stored in a Pinecone index or a LocalVectorStore
+def index_vector_count(index):
+
+    if isinstance(index, LocalVectorStore):
+        return len(index)
+
+    stats = index.describe_index_stats()
+
+    return stats["total_vector_count"] if isinstance(stats, dict) else stats.total_vector_count
+
+# An incremental sync needs the manifest of what is indexed, without it vectors upserted by other means
+# (e.g. the old sequential "0".."n" IDs) would never be deleted and every chunk would be retrieved twice
+def check_tracked_index(index, manifest):
+
+    if manifest["model"] is not None:
+        return
+
+    count = index_vector_count(index)
+    if count:
+        raise ValueError(f"The index holds {count} vectors but has no manifest, rebuild it with --mode full.")
+
+# This function will split the text into chunk and upsert them all
+# Chunk IDs are hashes of the source and content, so re-running it overwrites the same vectors
+def upsert_chunks_from(text_file, index=None, chunking=None, batch_size=upsert_batch_size, token_budget=embed_token_budget, retries=max_retries):
+
+    if index is None:
+        index = get_pinecone_index(index_name)
+
+    chunks_by_id = {chunk_id(chunk, text_file): chunk for chunk in split_chunks_from(text_file, chunking or default_chunking(text_file))}
+
+    return embed_and_upsert(chunks_by_id, index, text_file, batch_size, token_budget, retries)
+
+# This function only embeds and upserts new or changed chunks, and deletes chunks removed from the source
+# The manifest records what was last upserted, so the live index keeps serving throughout the sync
+# Set full to ignore the manifest, e.g. after the index has been dropped and recreated
+def sync_chunks_from(text_file, index=None, manifest_file=None, full=False, chunking=None, batch_size=upsert_batch_size, token_budget=embed_token_budget, retries=max_retries):
+
+    if index is None:
+        index = get_pinecone_index(index_name)
+    if manifest_file is None:
+        manifest_file = manifest_path(index_name, retrieval_backend)
+
+    manifest = load_manifest(manifest_file)
+    if not full:
+        check_tracked_index(index, manifest)
+
+    # A different embedding profile makes every stored vector stale
+    if full or (manifest["model"], manifest["dimensions"]) != (embedding_model, embedding_dimensions):
+        manifest = {"model": embedding_model, "dimensions": embedding_dimensions, "version": None, "chunks": {}}
+
+    chunks_by_id = {chunk_id(chunk, text_file): chunk for chunk in split_chunks_from(text_file, chunking or default_chunking(text_file))}
+    indexed = {id for id, entry in manifest["chunks"].items() if entry["source"] == text_file}
+
+    added = {id: chunk for id, chunk in chunks_by_id.items() if id not in indexed}
+    removed = sorted(indexed - chunks_by_id.keys())
+
+    print(f"Syncing '{text_file}': {len(added)} new or changed, {len(removed)} removed, "
+          f"{len(chunks_by_id) - len(added)} unchanged chunks.")
+
+    stats = embed_and_upsert(added, index, text_file, batch_size, token_budget, retries)
+    for id in added:
+        manifest["chunks"][id] = {"source": text_file}
+
+    for i in range(0, len(removed), batch_size):
+        call_with_retries(index.delete, ids=removed[i:i + batch_size], retries=retries)
+    for id in removed:
+        del manifest["chunks"][id]
+
+    save_manifest(manifest_file, manifest)
+
+    stats.update({"added": len(added), "removed": len(removed), "unchanged": len(chunks_by_id) - len(added)})
+
+    return stats
+
+# The local counterpart of ensure_index, returns (store, full) for a sync of the local snapshot
+# A snapshot built with another embedding profile or dimension is not loaded, the sync starts from an empty store instead
+def open_local_store(path=snapshot_path, manifest_file=None, incremental=True):
+
+    if not incremental:
+        return LocalVectorStore(), True
+
+    if manifest_file is None:
+        manifest_file = manifest_path(index_name, 'local')
+
+    store = LocalVectorStore(path)
+    if not len(store):
+        return store, False
+
+    manifest = load_manifest(manifest_file)
+    dimension = store.matrix.shape[1]
+    if dimension != embedding_dimensions or (manifest["model"], manifest["dimensions"]) != (embedding_model, embedding_dimensions):
+        print(f"Local snapshot was built with {manifest['model']} ({dimension} dimensions), "
+              f"rebuilding it for {embedding_model} ({embedding_dimensions} dimensions)...")
+        return LocalVectorStore(), True
+
+    return store, False
+
+# This function builds the local index snapshot loaded by retrieve_chunks when RETRIEVAL_BACKEND=local
+# In incremental mode the existing snapshot is synced and saved again
+def build_local_snapshot(text_file, path=snapshot_path, incremental=True, chunking=None):
+
+    manifest_file = manifest_path(index_name, 'local')
+    store, full = open_local_store(path, manifest_file, incremental)
+    stats = sync_chunks_from(text_file, index=store, manifest_file=manifest_file, full=full, chunking=chunking)
+    store.save(path)
+
+    return stats
 
 # Run the create_index, chunking and upserting from here
-create_index(index_name)
-upsert_chunks_from('data/glossary-tennis.csv')
+# Nothing is ingested on import, run this module as a script:
+#   python _load_chunks.py [--backend pinecone|local] [--mode incremental|full] [--file data/glossary-tennis.csv] [--chunking text|glossary]
+def main():
+
+    parser = argparse.ArgumentParser(description="Chunk, embed and upsert a text file into the Ten-AI index.")
+    parser.add_argument("--backend", choices=["pinecone", "local"], default=retrieval_backend)
+    parser.add_argument("--mode", choices=["incremental", "full"], default=index_sync_mode)
+    parser.add_argument("--file", default='data/glossary-tennis.csv')
+    parser.add_argument("--chunking", choices=["text", "glossary"], default=None, help="defaults to glossary for glossary files, text otherwise")
+    args = parser.parse_args()
+
+    if args.backend == 'local':
+        build_local_snapshot(args.file, incremental=args.mode != 'full', chunking=args.chunking)
+    elif args.mode == 'full':
+        create_index(index_name)
+        sync_chunks_from(args.file, manifest_file=manifest_path(index_name, 'pinecone'), full=True, chunking=args.chunking)
+    else:
+        ensure_index(index_name)
+        sync_chunks_from(args.file, manifest_file=manifest_path(index_name, 'pinecone'), chunking=args.chunking)
+
+if __name__ == "__main__":
+    main()
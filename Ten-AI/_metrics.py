@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Per-stage latency histograms, counters and slow request traces for the Ten-AI RAG path
+# Latency quantiles are computed over a sliding window of the most recent samples of each stage
+# and exposed with the totals in Prometheus text format
+metrics_window = int(os.getenv('METRICS_WINDOW', '2048'))
+slow_request_ms = float(os.getenv('SLOW_REQUEST_MS', '0'))
+
+quantiles = (0.5, 0.95, 0.99)
+metrics_prefix = "ten_ai"
+
+
+class Histogram:
+
+    def __init__(self, window=metrics_window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            **{f"p{int(q * 100)}": self.quantile(q) for q in quantiles},
+        }
+
+
+class Metrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.local = threading.local()
+
+    def observe(self, name, value, **labels):
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, value=1, **labels):
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # Gauges are read from a callback returning {name: value} when the metrics are rendered
+    def register_gauges(self, name, callback):
+
+        self.gauges[name] = callback
+
+    # Times a stage of the current request, the duration goes to the stage_seconds histogram and the request trace
+    @contextmanager
+    def span(self, stage):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("stage_seconds", elapsed, stage=stage)
+            trace = getattr(self.local, "trace", None)
+            if trace is not None:
+                trace.append((stage, elapsed))
+
+    def start_trace(self):
+
+        self.local.trace = []
+
+    # Records the request latency and logs the trace of stages when it is slower than threshold_ms
+    def finish_trace(self, name, elapsed, threshold_ms=slow_request_ms):
+
+        trace = getattr(self.local, "trace", None) or []
+        self.local.trace = None
+        self.observe("request_seconds", elapsed, endpoint=name)
+
+        if threshold_ms and elapsed * 1000 >= threshold_ms:
+            stages = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in trace)
+            print(f"Slow request {name}: {elapsed * 1000:.0f}ms [{stages}]")
+
+    def summary(self, name):
+
+        with self.lock:
+            return {"/".join(str(value) for _, value in labels): histogram.summary()
+                    for (metric, labels), histogram in self.histograms.items() if metric == name}
+
+    def render_prometheus(self):
+
+        lines = []
+
+        def label_text(labels, **extra):
+            pairs = list(labels) + list(extra.items())
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}" if pairs else ""
+
+        with self.lock:
+
+            for name in sorted({metric for metric, _ in self.histograms}):
+                full_name = f"{metrics_prefix}_{name}"
+                lines.append(f"# TYPE {full_name} summary")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    for q in quantiles:
+                        lines.append(f"{full_name}{label_text(labels, quantile=q)} {histogram.quantile(q):.6f}")
+                    lines.append(f"{full_name}_sum{label_text(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{full_name}_count{label_text(labels)} {histogram.count}")
+
+            for name in sorted({metric for metric, _ in self.counters}):
+                full_name = f"{metrics_prefix}_{name}_total"
+                lines.append(f"# TYPE {full_name} counter")
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f"{full_name}{label_text(labels)} {value}")
+
+        for group, callback in sorted(self.gauges.items()):
+            for name, value in sorted(callback().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    full_name = f"{metrics_prefix}_{group}_{name}"
+                    lines.append(f"# TYPE {full_name} gauge")
+                    lines.append(f"{full_name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -1,42 +1,49 @@
-import os
-from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
-
-# you need to do a pip install of LangChain, you can just use the text splitter
-# pip install -qU langchain-text-splitters
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import threading
+from _clients import get_pinecone_index, index_name, retrieval_backend
 from _embed_chunks import embed_chunks
+from _vector_store import LocalVectorStore, snapshot_path
+from _context_builder import build_context
+from _metrics import metrics
 
+local_index = None
+local_index_lock = threading.Lock()
 
-load_dotenv()
+# Returns the index for the configured retrieval backend
+# Both backends expose the same query interface
+def get_index():
 
-oa = OpenAI()
-pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-index_name = 'tennis-glossary'
+    global local_index
 
-# This will be used to retrieve chunks from Pinecone
-# Default chunks to retrieve is 5
-def retrieve_chunks(query=None, no_of_chunks=5):
-
-    # The query is embedded before querying Pinecone
-    embedding = embed_chunks(query)
-
-    index = pc.Index(index_name)
+    if retrieval_backend != 'local':
+        return get_pinecone_index(index_name)
 
-    response = index.query(
-        vector= embedding,
-        top_k=no_of_chunks,
-        include_metadata=True
-    )
+    if local_index is None:
+        with local_index_lock:
+            if local_index is None:
+                local_index = LocalVectorStore(snapshot_path)
 
-    retrieved_chunks = ""
+    return local_index
 
-    for match in response['matches']:
-
-        retrieved_chunks += "________________________________\n"
-        retrieved_chunks += "EXCERPT\n"
-        retrieved_chunks += "-------\n"
-        retrieved_chunks += match['metadata']['chunk'] + '\n'
+# This will be used to retrieve chunks from Pinecone
+# Default chunks to retrieve is 5, picked from a larger candidate pool by the context builder
+# Pass embedding to reuse a question embedding that has already been computed
+def retrieve_chunks(query=None, no_of_chunks=5, embedding=None, no_of_candidates=None):
 
-    return retrieved_chunks
+    # The query is embedded before querying Pinecone
+    if embedding is None:
+        with metrics.span("embed"):
+            embedding = embed_chunks(query)
+
+    index = get_index()
+
+    # The vectors are returned so near-duplicate candidates can be skipped
+    with metrics.span("vector_query"):
+        response = index.query(
+            vector= embedding,
+            top_k=no_of_candidates or no_of_chunks * 3,
+            include_metadata=True,
+            include_values=True
+        )
+
+    with metrics.span("context_build"):
+        return build_context(response['matches'], embedding, max_chunks=no_of_chunks)
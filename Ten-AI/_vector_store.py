@@ -0,0 +1,253 @@
+import os
+import json
+import threading
+import numpy as np
+
+# Local, in-process vector index used as an alternative to the Pinecone index
+# All vectors live in one contiguous matrix with L2-normalized rows, so a cosine
+# top-k query is a single matrix-vector product followed by argpartition
+# The matrix is a view of a growable buffer, an upsert only normalizes (and quantizes) its own rows,
+# appends new rows and overwrites updated rows in place
+snapshot_path = os.getenv('LOCAL_INDEX_PATH', os.path.join(os.path.dirname(__file__), 'data', 'snapshots', 'tennis-glossary'))
+
+# Set LOCAL_INDEX_QUANTIZATION=int8 to store int8 vectors with one float32 scale per vector (4x smaller than float32)
+index_quantization = os.getenv('LOCAL_INDEX_QUANTIZATION', 'float32').lower()
+
+# Rows of an int8 matrix are converted to float32 in blocks of this size while querying
+query_block_rows = 8192
+
+# Minimum number of rows of the growable buffer, it doubles when full
+min_buffer_rows = 1024
+
+
+def normalize_rows(matrix):
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+
+    return matrix / norms
+
+
+# Symmetric per-vector quantization, each row is stored as round(row / scale) with scale = max(|row|) / 127
+def quantize_rows(matrix):
+
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_rows(codes, scales):
+
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class LocalVectorStore:
+    """
+    Pinecone compatible subset (upsert, delete, query) backed by a NumPy matrix.
+
+    snapshot_path: Path prefix of the snapshot, stored as <prefix>.npy (vectors), <prefix>.scales.npy (int8 only) and <prefix>.json (ids and metadata).
+    quantization: 'float32' or 'int8', a loaded snapshot keeps the quantization it was saved with.
+    """
+
+    def __init__(self, snapshot_path=None, quantization=index_quantization):
+        self.lock = threading.Lock()
+        self.quantization = quantization
+        self.ids = []
+        self.metadata = []
+        self.positions = {}
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.scales = None
+        # Growable buffers the matrix and scales are views of, None until the first upsert
+        self.buffer = None
+        self.scales_buffer = None
+
+        if snapshot_path is not None and os.path.exists(snapshot_path + '.npy'):
+            self.load(snapshot_path)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Memory used by the vectors (and scales) in bytes, including the unused rows of the growable buffer
+    @property
+    def nbytes(self):
+        if self.buffer is not None:
+            return self.buffer.nbytes + (0 if self.scales_buffer is None else self.scales_buffer.nbytes)
+        return self.matrix.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    # The matrix is memory-mapped read-only, pages are only touched when queried
+    def load(self, path):
+
+        with open(path + '.json') as file:
+            snapshot = json.load(file)
+
+        with self.lock:
+            self.quantization = snapshot.get("quantization", "float32")
+            self.matrix = np.load(path + '.npy', mmap_mode='r')
+            self.scales = np.load(path + '.scales.npy') if self.quantization == 'int8' else None
+            self.ids = snapshot["ids"]
+            self.metadata = snapshot["metadata"]
+            self.positions = {id: i for i, id in enumerate(self.ids)}
+            self.buffer = self.scales_buffer = None
+
+        print(f"Loaded local index snapshot '{path}' ({len(self.ids)} vectors, dimension {self.matrix.shape[1]}, {self.quantization}).")
+
+    # Write to temporary files first so a running reader never sees a partial snapshot
+    def save(self, path):
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with self.lock:
+            with open(path + '.npy.tmp', 'wb') as file:
+                np.save(file, np.ascontiguousarray(self.matrix))
+            if self.scales is not None:
+                with open(path + '.scales.npy.tmp', 'wb') as file:
+                    np.save(file, self.scales)
+            with open(path + '.json.tmp', 'w') as file:
+                json.dump({"quantization": self.quantization, "ids": self.ids, "metadata": self.metadata}, file)
+
+        os.replace(path + '.npy.tmp', path + '.npy')
+        if self.scales is not None:
+            os.replace(path + '.scales.npy.tmp', path + '.scales.npy')
+        os.replace(path + '.json.tmp', path + '.json')
+
+        print(f"Saved local index snapshot '{path}' ({len(self.ids)} vectors, {self.quantization}).")
+
+    # Normalized (and quantized) rows as stored in the matrix
+    def _encode(self, matrix):
+
+        matrix = normalize_rows(matrix)
+
+        if self.quantization == 'int8':
+            return quantize_rows(matrix)
+
+        return matrix.astype(np.float32, copy=False), None
+
+    # Grow the buffer to hold at least rows vectors, copying the current matrix once per doubling
+    def _reserve(self, rows, dimension):
+
+        if self.buffer is not None and len(self.buffer) >= rows:
+            return
+
+        count = len(self.matrix)
+        capacity = max(rows, min_buffer_rows, 2 * (0 if self.buffer is None else len(self.buffer)))
+        dtype = np.int8 if self.quantization == 'int8' else np.float32
+
+        buffer = np.empty((capacity, dimension), dtype=dtype)
+        if count:
+            buffer[:count] = self.matrix
+        self.buffer = buffer
+
+        if self.quantization == 'int8':
+            scales_buffer = np.empty(capacity, dtype=np.float32)
+            if count:
+                scales_buffer[:count] = self.scales
+            self.scales_buffer = scales_buffer
+
+    def upsert(self, vectors):
+
+        # The rows are validated and encoded before any bookkeeping changes, so a failed upsert leaves the store as it was
+        # id -> index into vectors, a later vector with the same ID wins
+        latest = {vector["id"]: i for i, vector in enumerate(vectors)}
+
+        if not latest:
+            return {"upserted_count": 0}
+
+        codes, scales = self._encode(np.vstack([np.asarray(vectors[i]["values"], dtype=np.float32) for i in latest.values()]))
+
+        with self.lock:
+
+            if self.matrix.size and codes.shape[1] != self.matrix.shape[1]:
+                raise ValueError(f"Vector dimension {codes.shape[1]} does not match the index dimension {self.matrix.shape[1]}.")
+
+            positions = []
+
+            for id, i in latest.items():
+
+                position = self.positions.get(id)
+
+                if position is None:
+                    position = self.positions[id] = len(self.ids)
+                    self.ids.append(id)
+                    self.metadata.append(vectors[i].get("metadata", {}))
+                else:
+                    self.metadata[position] = vectors[i].get("metadata", {})
+
+                positions.append(position)
+
+            self._reserve(len(self.ids), codes.shape[1])
+            self.buffer[positions] = codes
+            if scales is not None:
+                self.scales_buffer[positions] = scales
+
+            # Queries snapshot the matrix view under the lock, appended rows are outside their view
+            self.matrix = self.buffer[:len(self.ids)]
+            self.scales = None if scales is None else self.scales_buffer[:len(self.ids)]
+
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids):
+
+        with self.lock:
+
+            remove = set(ids) & self.positions.keys()
+
+            if not remove:
+                return {}
+
+            keep = [i for i, id in enumerate(self.ids) if id not in remove]
+            self.matrix = np.ascontiguousarray(self.matrix[keep])
+            if self.scales is not None:
+                self.scales = self.scales[keep]
+            self.ids = [self.ids[i] for i in keep]
+            self.metadata = [self.metadata[i] for i in keep]
+            self.positions = {id: i for i, id in enumerate(self.ids)}
+            self.buffer = self.scales_buffer = None
+
+        return {}
+
+    def _scores(self, matrix, scales, query):
+
+        if scales is None:
+            return matrix @ query
+
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), query_block_rows):
+            block = matrix[start:start + query_block_rows]
+            scores[start:start + len(block)] = (block.astype(np.float32) @ query) * scales[start:start + len(block)]
+
+        return scores
+
+    # Returns the same response shape as the Pinecone index query
+    def query(self, vector, top_k=5, include_metadata=True, include_values=False):
+
+        # upsert appends to the ids and metadata lists in place, so the query works on copies bounded by the matrix
+        with self.lock:
+            matrix, scales = self.matrix, self.scales
+            ids, metadata = self.ids[:len(matrix)], self.metadata[:len(matrix)]
+
+        if not ids:
+            return {"matches": []}
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self._scores(matrix, scales, query)
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for i in top:
+            match = {"id": ids[i], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = metadata[i]
+            if include_values:
+                row = matrix[i].astype(np.float32)
+                match["values"] = (row if scales is None else row * scales[i]).tolist()
+            matches.append(match)
+
+        return {"matches": matches}
@@ -1,9 +1,36 @@
-from flask import Flask, render_template, request
-from chatbot import respond_to_question
+import json
+import time
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, g
+from chatbot import respond_to_question, respond_to_questions, stream_response_to_question, answer_cache_stats
+from _embed_chunks import embedding_cache_stats
+from _retrieve_chunks import get_index, retrieval_backend
+from _glossary import get_glossary
+from _metrics import metrics
 
 # Create instance of the app class
 app = Flask(__name__)
 
+# Load the glossary term dictionary and the local index snapshot at startup rather than on the first question
+get_glossary()
+if retrieval_backend == 'local':
+    get_index()
+
+# Cache statistics are exported as gauges on /metrics
+metrics.register_gauges("answer_cache", answer_cache_stats)
+metrics.register_gauges("embedding_cache", embedding_cache_stats)
+
+# Every request is timed and traced, slow requests are logged stage by stage (SLOW_REQUEST_MS)
+@app.before_request
+def start_request_trace():
+    g.request_start = time.perf_counter()
+    metrics.start_trace()
+
+@app.after_request
+def finish_request_trace(response):
+    if request.endpoint not in (None, "metrics_endpoint", "static"):
+        metrics.finish_trace(request.path, time.perf_counter() - g.request_start)
+    return response
+
 
 @app.route("/") # Use the route() decorator to bind function to the "base" url endpoint
 def home():
@@ -16,5 +43,62 @@ def response():
     #return str(bot.get_response(userText))
     return response
 
+# Largest list of questions accepted by /batch
+batch_max_questions = 500
+
+@app.route("/batch", methods=["POST"]) # Answers a JSON list of questions: {"questions": [...]}
+def batch_response():
+    data = request.get_json(silent=True) or {}
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not all(isinstance(question, str) for question in questions):
+        return jsonify({"error": "Expected a JSON body with a list of question strings in 'questions'."}), 400
+    if len(questions) > batch_max_questions:
+        return jsonify({"error": f"At most {batch_max_questions} questions per batch."}), 400
+
+    start = time.perf_counter()
+    answers = respond_to_questions(questions)
+    elapsed = time.perf_counter() - start
+
+    return jsonify({
+        "answers": answers,
+        "seconds": elapsed,
+        "questions_per_second": len(questions) / elapsed if elapsed else 0.0,
+    })
+
+@app.route("/stream") # Streams the answer to the browser as server-sent events
+def stream_response():
+    userText = request.args.get('msg')
+
+    # Time to first token and total latency are recorded separately, the request trace only covers the setup
+    def events():
+        start = time.perf_counter()
+        ttfb = None
+        for token in stream_response_to_question(userText):
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            yield f"data: {json.dumps({'token': token})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+        total = time.perf_counter() - start
+        ttfb = total if ttfb is None else ttfb
+        metrics.observe("stream_seconds", ttfb, phase="first_token")
+        metrics.observe("stream_seconds", total, phase="total")
+        print(f"/stream time to first token {ttfb * 1000:.0f}ms, total {total * 1000:.0f}ms")
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics") # Prometheus text format metrics
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/stats") # Cache hit ratios and estimated latency saved
+def stats():
+    return jsonify({
+        "answer_cache": answer_cache_stats(),
+        "embedding_cache": embedding_cache_stats(),
+        "stages": metrics.summary("stage_seconds"),
+        "stream": metrics.summary("stream_seconds"),
+    })
+
 if __name__ == "__main__":
   app.run(debug=True)
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import _clients
+import _embedding_cache
+import _retrieve_chunks
+import chatbot
+from _fakes import FakeOpenAI, FakePineconeIndex
+from _load_chunks import sync_chunks_from
+
+# Offline end-to-end benchmarks for Ten-AI
+# OpenAI and Pinecone are replaced by local stand-ins with configurable latency and deterministic outputs,
+# so ingestion, respond_to_question and the Flask /get route can be measured without network access
+#   python benchmark.py                  run and compare against benchmarks/baseline.json
+#   python benchmark.py --save-baseline  run and store the results as the new baseline
+
+baseline_path = os.path.join(os.path.dirname(__file__), 'benchmarks', 'baseline.json')
+
+topics = ["footwork", "grip", "serve toss", "split step", "return position", "second serve", "court coverage", "net approach"]
+surfaces = ["clay", "grass", "hard courts", "indoor carpet"]
+
+
+# Unique questions that miss the glossary fast path and the embedding cache
+def benchmark_questions(count, offset=0):
+
+    return [f"How should a player adjust their {topics[i % len(topics)]} when playing on "
+            f"{surfaces[i % len(surfaces)]} (scenario {offset + i})?" for i in range(count)]
+
+
+def install_fakes(args):
+
+    fake_openai = FakeOpenAI(embed_latency=args.embed_latency, chat_latency=args.chat_latency,
+                             tokens_per_second=args.tokens_per_second)
+    index = FakePineconeIndex(latency=args.index_latency)
+
+    _clients.set_client('openai', fake_openai)
+    _clients.set_client(f'pinecone-index:{_clients.index_name}', index)
+    _embedding_cache.embedding_cache = _embedding_cache.EmbeddingCache(':memory:')
+    _retrieve_chunks.retrieval_backend = 'pinecone'
+    chatbot.use_answer_cache = args.answer_cache
+
+    return fake_openai, index
+
+
+def percentiles(latencies):
+
+    return {f"p{q}_ms": float(np.percentile(latencies, q) * 1000) for q in (50, 95, 99)}
+
+
+def benchmark_ingestion(index):
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        stats = sync_chunks_from('data/glossary-tennis.csv', index=index, manifest_file=os.path.join(directory, 'manifest.json'), full=True)
+        elapsed = time.perf_counter() - start
+
+    return {"chunks": stats["chunks"], "seconds": elapsed, "throughput": stats["chunks"] / elapsed}
+
+
+# Runs call(question) for every question on a pool of `concurrency` threads
+def run_load(call, questions, concurrency):
+
+    latencies = []
+    lock = threading.Lock()
+
+    def timed(question):
+        start = time.perf_counter()
+        call(question)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, questions))
+    elapsed = time.perf_counter() - start
+
+    return {"requests": len(questions), "concurrency": concurrency, "throughput": len(questions) / elapsed, **percentiles(latencies)}
+
+
+# Allocations are measured on a separate serial run, tracemalloc would distort the timings
+def measure_allocations(call, questions):
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    for question in questions:
+        call(question)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+
+    return {"alloc_kb_per_request": allocated / 1024 / len(questions), "alloc_blocks_per_request": blocks / len(questions),
+            "peak_kb": peak / 1024}
+
+
+def flask_caller():
+
+    from app import app
+
+    local = threading.local()
+
+    def call(question):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        response = local.client.get("/get", query_string={"msg": question})
+        if response.status_code != 200:
+            raise RuntimeError(f"/get returned {response.status_code}")
+
+    return call
+
+
+def run_benchmarks(args):
+
+    _, index = install_fakes(args)
+    results = {"ingestion": benchmark_ingestion(index)}
+    print(f"ingestion: {results['ingestion']['throughput']:.1f} chunks/sec")
+
+    callers = {"respond_to_question": chatbot.respond_to_question, "flask_get": flask_caller()}
+    offset = 0
+
+    for name, call in callers.items():
+
+        for concurrency in args.concurrency:
+            questions = benchmark_questions(args.requests, offset)
+            offset += len(questions)
+            result = run_load(call, questions, concurrency)
+            results[f"{name}@c{concurrency}"] = result
+            print(f"{name} c={concurrency}: {result['throughput']:.1f} req/sec, "
+                  f"p50 {result['p50_ms']:.0f}ms p95 {result['p95_ms']:.0f}ms p99 {result['p99_ms']:.0f}ms")
+
+        allocations = measure_allocations(call, benchmark_questions(args.alloc_requests, offset))
+        offset += args.alloc_requests
+        results[f"{name}@alloc"] = allocations
+        print(f"{name} allocations: {allocations['alloc_kb_per_request']:.1f} KB/request, "
+              f"{allocations['alloc_blocks_per_request']:.0f} blocks/request, peak {allocations['peak_kb']:.0f} KB")
+
+    return results
+
+
+# Lower throughput or higher p95 latency than the baseline by more than tolerance is a regression
+def compare_to_baseline(results, baseline, tolerance):
+
+    regressions = []
+
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if "throughput" in result and result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:.1f} < baseline {base['throughput']:.1f}")
+        if "p95_ms" in result and result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.0f}ms > baseline {base['p95_ms']:.0f}ms")
+        if "alloc_kb_per_request" in result and result["alloc_kb_per_request"] > base["alloc_kb_per_request"] * (1 + tolerance):
+            regressions.append(f"{name}: {result['alloc_kb_per_request']:.1f} KB/request > baseline {base['alloc_kb_per_request']:.1f}")
+
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Offline Ten-AI benchmarks with fake OpenAI and Pinecone clients.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=48, help="requests per concurrency level")
+    parser.add_argument("--alloc-requests", type=int, default=10)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--index-latency", type=float, default=0.015)
+    parser.add_argument("--chat-latency", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=1000)
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache enabled")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Saved baseline to '{args.baseline}'.")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at '{args.baseline}', run with --save-baseline to create one.")
+        return
+
+    with open(args.baseline) as file:
+        regressions = compare_to_baseline(results, json.load(file), args.tolerance)
+
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        raise SystemExit(1)
+
+    print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,54 @@
-from openai import OpenAI
-from pinecone import Pinecone
-
-# Here we're using dotenv (pip install python-dotenv) to manage environment vars
-from dotenv import load_dotenv
+# The shared client registry loads the environment vars with dotenv (pip install python-dotenv)
+from _clients import get_openai, index_name, retrieval_backend
 from _retrieve_chunks import retrieve_chunks
+from _embed_chunks import embed_chunks, embed_chunks_batch
+from _answer_cache import SemanticAnswerCache
+from _index_manifest import index_version, manifest_path
+from _glossary import get_glossary
+from _context_builder import format_context
+from _metrics import metrics
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Set ANSWER_CACHE=off to always generate a fresh answer
+use_answer_cache = os.getenv('ANSWER_CACHE', 'on').lower() != 'off'
+answer_cache = SemanticAnswerCache()
+
+# Set GLOSSARY_FAST_PATH=off to send questions about known terms through vector search too
+use_glossary_fast_path = os.getenv('GLOSSARY_FAST_PATH', 'on').lower() != 'off'
+
+# Maximum number of questions answered concurrently by respond_to_questions
+batch_concurrency = int(os.getenv('BATCH_CONCURRENCY', '8'))
+
+# The index version is re-read from the manifest at most this often (seconds)
+index_version_check_interval = float(os.getenv('INDEX_VERSION_CHECK_INTERVAL', '30'))
+index_version_checked_at = 0.0
+
+# Cached answers are invalidated when the indexed chunks change
+def check_index_version():
 
+    global index_version_checked_at
 
-load_dotenv()
+    now = time.monotonic()
+    if now - index_version_checked_at >= index_version_check_interval:
+        index_version_checked_at = now
+        if answer_cache.set_index_version(index_version(manifest_path(index_name, retrieval_backend))):
+            print("Index version changed, answer cache cleared.")
 
-oa = OpenAI()  # alternatively self.client = OpenAI(api_key=<<your OPENAI_API_KEY>>)
-pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
+# Hit ratio and latency saved by the answer cache
+def answer_cache_stats():
+
+    return answer_cache.stats()
+
+# Records the token counts reported in the completion usage
+def record_usage(usage):
+    if usage is None:
+        return
+
+    metrics.increment("completion_tokens", usage.prompt_tokens, kind="prompt")
+    metrics.increment("completion_tokens", usage.completion_tokens, kind="completion")
 
 # In this function we will create the system message and include the relevant context
 def inject_context_data(context):
@@ -37,22 +75,186 @@ def inject_context_data(context):
     return system_message
 
 
-def respond_to_question(question):
-    context_data = retrieve_chunks(question)
+# Builds the chat messages for questions that name a known glossary term, with the term's entry as the only context
+# Many glossary lines are cut off mid-sentence, so the entry is completed by the model rather than returned verbatim
+# Returns None for everything else, which falls through to vector search
+def glossary_messages(question):
+    if not use_glossary_fast_path:
+        return None
+
+    with metrics.span("glossary"):
+        entry = get_glossary().lookup(question)
+    if entry is None:
+        return None
+
+    term, definition = entry
+    system_message = inject_context_data(format_context([f"{term}: {definition}"]))
+
+    return [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": question},
+    ]
+
+# This function builds the chat messages for a question, retrieval always finishes here
+def build_messages(question, embedding=None):
+    context_data = retrieve_chunks(question, embedding=embedding)
     system_message = inject_context_data(context_data)
 
+    return [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": question},
+    ]
+
+# Returns the cached answer for the question embedding, or None
+def cached_answer(embedding):
+    if not use_answer_cache:
+        return None
+
+    check_index_version()
+
+    with metrics.span("answer_cache"):
+        answer = answer_cache.lookup(embedding)
+
+    metrics.increment("answer_cache_lookups", result="hit" if answer is not None else "miss")
+
+    return answer
+
+
+# Calls the completion for the chat messages and returns the answer
+def complete(messages):
+
     # Call the OpenAI API with your systems message and question
-    response = oa.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": question},
-        ]
-    )
+    with metrics.span("completion"):
+        response = get_openai().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages
+        )
+
+    record_usage(getattr(response, "usage", None))
 
     # Parse the response to an answer and return it
     return response.choices[0].message.content
 
+# This function retrieves the context and calls the completion for an embedded question
+def answer_from_embedding(question, embedding, start):
+
+    answer = complete(build_messages(question, embedding))
+
+    if use_answer_cache:
+        answer_cache.store(question, embedding, answer, time.perf_counter() - start)
+
+    return answer
+
+
+def respond_to_question(question):
+    messages = glossary_messages(question)
+    if messages is not None:
+        return complete(messages)
+
+    start = time.perf_counter()
+
+    # The question embedding is shared by the answer cache lookup and the vector query
+    with metrics.span("embed"):
+        embedding = embed_chunks(question)
+
+    answer = cached_answer(embedding)
+    if answer is not None:
+        return answer
+
+    return answer_from_embedding(question, embedding, start)
+
+# Batch version of respond_to_question
+# All questions are embedded in one request, then retrieval and completion run on a pool of max_workers threads
+# Returns one {"question", "answer", "error"} dict per question, in input order
+def respond_to_questions(questions, max_workers=batch_concurrency):
+    start = time.perf_counter()
+    results = [{"question": question, "answer": None, "error": None} for question in questions]
+
+    pending = []
+    glossary = []
+    for i, question in enumerate(questions):
+        try:
+            messages = glossary_messages(question)
+        except Exception as e:
+            results[i]["error"] = str(e)
+            continue
+        if messages is not None:
+            glossary.append((i, messages))
+        else:
+            pending.append(i)
+
+    embeddings = []
+    if pending:
+        try:
+            with metrics.span("embed_batch"):
+                embeddings = embed_chunks_batch([questions[i] for i in pending])
+        except Exception as e:
+            for i in pending:
+                results[i]["error"] = f"Embedding failed: {e}"
+            pending = []
+
+    if not pending and not glossary:
+        return results
+
+    def answer(i, embedding):
+        cached = cached_answer(embedding)
+        if cached is not None:
+            return cached
+        return answer_from_embedding(questions[i], embedding, start)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(i, executor.submit(complete, messages)) for i, messages in glossary]
+        futures += [(i, executor.submit(answer, i, embedding)) for i, embedding in zip(pending, embeddings)]
+
+        for i, future in futures:
+            try:
+                results[i]["answer"] = future.result()
+            except Exception as e:
+                results[i]["error"] = str(e)
+
+    return results
+
+# Streaming version of respond_to_question, yields the answer as it is generated
+# Retrieval completes before the completion is requested, so the first token is already answer text
+def stream_response_to_question(question):
+    start = time.perf_counter()
+    embedding = None
+
+    messages = glossary_messages(question)
+    if messages is None:
+        with metrics.span("embed"):
+            embedding = embed_chunks(question)
+
+        answer = cached_answer(embedding)
+        if answer is not None:
+            yield answer
+            return
+
+        messages = build_messages(question, embedding)
+
+    # The final chunk of the stream carries the token usage
+    completion_start = time.perf_counter()
+    stream = get_openai().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    tokens = []
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            token = chunk.choices[0].delta.content
+            tokens.append(token)
+            yield token
+        if getattr(chunk, "usage", None):
+            record_usage(chunk.usage)
+
+    metrics.observe("stage_seconds", time.perf_counter() - completion_start, stage="completion_stream")
+
+    if use_answer_cache and embedding is not None:
+        answer_cache.store(question, embedding, "".join(tokens), time.perf_counter() - start)
+
 def bold_str(s):
     return f"\033[1m{s}\033[0m"
 